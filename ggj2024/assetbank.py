@@ -0,0 +1,102 @@
+"""Preloaded textures for spawnable items, so spawning an item never touches the disk or computes a hit box"""
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+import numpy as np
+import arcade
+from arcade import PointList
+
+from ggj2024.config import *
+from ggj2024 import hitboxcache
+
+
+@dataclass
+class SpawnableVariant:
+    """A texture at one of the pre-computed spawn sizes"""
+    texture: arcade.Texture
+    width: float
+    height: float
+    # Size factor relative to the base item size (used to scale the mass)
+    scale: float
+    # Hit box already rescaled to width/height
+    hit_box: PointList
+
+
+class SpawnableAssetBank:
+    """Decodes and hit-boxes a set of item images once and hands out ready-made sprites"""
+
+    def __init__(self, filenames: Iterable[str | Path], hit_box_algorithm: str = 'Simple', size_variants: int = SPAWNABLE_SIZE_VARIANTS):
+        self.filenames = [str(f) for f in filenames]
+        self.hit_box_algorithm = hit_box_algorithm
+        self.size_variants = size_variants
+        self.textures: dict[str, arcade.Texture] = {}
+        self._variants: dict[tuple, list[list[SpawnableVariant]]] = {}
+
+    @property
+    def is_loaded(self) -> bool:
+        return len(self.textures) == len(self.filenames)
+
+    def _load_texture(self, filename: str) -> arcade.Texture:
+        texture = hitboxcache.load_texture(filename, hit_box_algorithm=self.hit_box_algorithm)
+        # With hit_box_algorithm="None" arcade computes the (trivial) hit box lazily, do it now
+        texture.hit_box_points
+        return texture
+
+    def load(self, workers: int = 0):
+        """Load all textures that are not loaded yet. With `workers` > 0 they are decoded on a thread pool."""
+        missing = [f for f in self.filenames if f not in self.textures]
+        if not missing:
+            return
+        if workers > 0:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='assetbank') as executor:
+                textures = list(executor.map(self._load_texture, missing))
+        else:
+            textures = [self._load_texture(f) for f in missing]
+        self.textures.update(zip(missing, textures))
+
+    def get_texture(self, filename: str | Path) -> arcade.Texture:
+        filename = str(filename)
+        texture = self.textures.get(filename)
+        if texture is None:
+            texture = self.textures[filename] = self._load_texture(filename)
+        return texture
+
+    def get_variants(self, item_size: tuple[float, float], max_scale: Optional[float] = None) -> list[list[SpawnableVariant]]:
+        """All size variants ([texture][size]) for an item size and a maximum scale factor"""
+        key = (tuple(item_size), max_scale)
+        variants = self._variants.get(key)
+        if variants is None:
+            self.load()
+            if max_scale:
+                scales = np.linspace(1, max_scale, self.size_variants)
+            else:
+                scales = [1.0]
+            base_w, base_h = item_size
+            variants = []
+            for filename in self.filenames:
+                texture = self.textures[filename]
+                texture_variants = []
+                for s in scales:
+                    w, h = int(base_w * s), int(base_h * s)
+                    sx, sy = w / texture.width, h / texture.height
+                    hit_box = [(x * sx, y * sy) for x, y in texture.hit_box_points]
+                    texture_variants.append(SpawnableVariant(texture, w, h, float(s), hit_box))
+                variants.append(texture_variants)
+            self._variants[key] = variants
+        return variants
+
+    def random_variant(self, item_size: tuple[float, float], max_scale: Optional[float] = None) -> SpawnableVariant:
+        variants = self.get_variants(item_size, max_scale)
+        texture_variants = variants[np.random.randint(len(variants))]
+        return texture_variants[np.random.randint(len(texture_variants))]
+
+    @staticmethod
+    def create_sprite(variant: SpawnableVariant, center_x: float = 0, center_y: float = 0) -> arcade.Sprite:
+        sprite = arcade.Sprite(texture=variant.texture, center_x=center_x, center_y=center_y)
+        # Set the size before the hit box, otherwise arcade would rescale the hit box point by point
+        sprite.width = variant.width
+        sprite.height = variant.height
+        sprite.hit_box = variant.hit_box
+        return sprite
@@ -0,0 +1 @@
+"""Headless performance benchmarks, run them with `python -m ggj2024.benchmarks.<name>`"""
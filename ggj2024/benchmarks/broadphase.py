@@ -0,0 +1,105 @@
+"""Compare pymunk's bounding box tree with the spatial hash broadphase on every level.
+
+Builds the physics of each level without a window (static layers and items like `GameWindow.load_level`),
+then keeps spawning blood particle bursts and steps the simulation. Reports physics steps per second.
+
+    python -m ggj2024.benchmarks.broadphase [--steps 2000] [--repeat 3] [1 2 ...]
+"""
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+from ggj2024.config import *
+from ggj2024.levels import LEVELS
+from ggj2024 import levelcache
+from ggj2024.physics_engine import PhysicsEngine
+from ggj2024.sprites import ParticleSprite
+
+
+STEP_DELTA_T = 1 / (60 * STEPS_PER_FRAME)
+
+
+def build_engine(tile_map, spatial_hash: bool) -> PhysicsEngine:
+    """Physics engine with the static layers and items of a level"""
+    engine = PhysicsEngine(damping=DEFAULT_DAMPING, gravity=(0, -GRAVITY))
+    engine.add_static_sprite_list(tile_map.sprite_lists['Platforms'],
+                                  friction=WALL_FRICTION,
+                                  collision_type='wall',
+                                  merge_tiles=MERGE_STATIC_TILES)
+    engine.add_static_sprite_list(tile_map.sprite_lists['Background'],
+                                  collision_type='background',
+                                  disable_collisions_for=['player', 'item', 'wall', 'soft', 'finish'],
+                                  merge_tiles=MERGE_STATIC_TILES)
+    engine.add_static_sprite_list(tile_map.sprite_lists.get('Soft') or [],
+                                  collision_type='soft',
+                                  elasticity=1.0,
+                                  merge_tiles=MERGE_STATIC_TILES)
+    engine.add_sprite_list(tile_map.sprite_lists['Dynamic Items'],
+                           friction=DYNAMIC_ITEM_FRICTION,
+                           collision_type='item',
+                           disable_collisions_for=['background', 'finish'])
+
+    def remove_particle(particle, other, arbiter, space, data):
+        if particle in engine.sprites:
+            engine.remove_sprite(particle)
+        return False
+
+    for other in ('wall', 'background', 'soft', 'item'):
+        engine.add_collision_handler('particle', other, begin_handler=remove_particle)
+
+    if spatial_hash:
+        engine.use_spatial_hash(tile_map.tile_width * tile_map.scaling,
+                                expected_bodies=MAX_SPAWNED_ITEMS + BLOOD_PARTICLES_PER_SPLATTER)
+    return engine
+
+
+def spawn_particles(engine: PhysicsEngine, position: tuple[float, float], count: int):
+    x, y = position
+    for _ in range(count):
+        particle_size = np.random.rand() * BLOOD_PARTICLE_SIZE_RANGE + BLOOD_PARTICLE_SIZE_MIN
+        particle = ParticleSprite(x, y, particle_size, 0.5)
+        engine.add_sprite(particle, 0.5, radius=particle_size, collision_type='particle')
+        engine.apply_impulse(particle, tuple((np.random.rand(2) - .5) * BLOOD_IMPULSE))
+
+
+def run(tile_map, spatial_hash: bool, steps: int, splatter_interval: int, seed: int = 0) -> float:
+    """Simulate `steps` physics steps, returns steps per second"""
+    np.random.seed(seed)
+    engine = build_engine(tile_map, spatial_hash)
+    map_width = tile_map.width * tile_map.tile_width * tile_map.scaling
+    map_height = tile_map.height * tile_map.tile_height * tile_map.scaling
+    # Particle bursts are created outside of the timed section, only stepping is measured
+    elapsed = 0.0
+    for step in range(steps):
+        if step % splatter_interval == 0:
+            spawn_particles(engine, (np.random.rand() * map_width, np.random.rand() * map_height), BLOOD_PARTICLES_PER_SPLATTER)
+        start = time.perf_counter()
+        engine.step(STEP_DELTA_T, resync_sprites=(step % STEPS_PER_FRAME == STEPS_PER_FRAME - 1))
+        elapsed += time.perf_counter() - start
+    return steps / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the bounding box tree and spatial hash broadphases')
+    parser.add_argument('levels', nargs='*', type=int, default=list(LEVELS.keys()), help='Level numbers (default: all)')
+    parser.add_argument('--steps', type=int, default=2000, help='Physics steps per run')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per level and broadphase (the median is reported)')
+    parser.add_argument('--splatter-interval', type=int, default=60, help='Spawn a blood splatter every n steps')
+    args = parser.parse_args()
+
+    print(f'{"Level":<12} {"Tree [steps/s]":>15} {"Hash [steps/s]":>15} {"Speedup":>8}')
+    for level_id in args.levels:
+        level = LEVELS[level_id]
+        tile_map = levelcache.load_tilemap(level.tilemap_file, level.scaling)
+        results = {}
+        for spatial_hash in (False, True):
+            results[spatial_hash] = statistics.median(run(tile_map, spatial_hash, args.steps, args.splatter_interval, seed)
+                                                      for seed in range(args.repeat))
+        print(f'{Path(level.tilemap_file).stem:<12} {results[False]:>15.0f} {results[True]:>15.0f} {results[True] / results[False]:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""Scripted gameplay scenarios on every level, run headless through `Simulation`.
+
+Every level (including the test maps) is played with a few scripted loads: item spawners at full rate,
+repeated player deaths with blood bursts, a continuously rotating gravity, platforms dragged around the
+player, and all of them at once. Reported are physics steps per second (whole frames, like the game runs
+them), the p50/p99 time of a single step and the time spent in collision handlers.
+Results are written as JSON, compare two of them to judge a change against a baseline:
+
+    python -m ggj2024.benchmarks.scenarios run [--levels Level1 SpawnerTest] [--scenarios blood] -o new.json
+    python -m ggj2024.benchmarks.scenarios compare baseline.json new.json
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Callable, Optional
+
+import arcade
+import numpy as np
+
+from ggj2024.config import *
+from ggj2024.levels import LEVELS, MECHANICS, Level, LevelRegistry
+from ggj2024.itemspawner import ItemSpawner
+from ggj2024.simulation import Simulation
+
+
+# Test maps that are not part of the game and their mechanics
+EXTRA_MAPS = {
+    'resources/tiled_maps/SpawnerTest.json': MECHANICS.PLATFORMS,
+    'resources/tiled_maps/gravity_test.json': MECHANICS.GRAVITY,
+}
+
+FRAME_DELTA_T = 1 / 60
+# Item spawners spawn this often (seconds), levels without spawners get one at the player start
+SPAWN_INTERVAL = 0.1
+# The player dies this often (seconds)
+KILL_INTERVAL = 1.0
+# Angular velocity of the gravity (rad/s)
+GRAVITY_TURN_RATE = np.pi / 2
+# Platforms circle the player at this distance and speed (rad/s), they are dropped (active) every other second
+PLATFORM_DISTANCE = 150
+PLATFORM_TURN_RATE = np.pi
+
+
+def benchmark_levels() -> dict[str, Level]:
+    """Fresh (unloaded) copies of all levels by name, so every run starts from the map as it is on disk"""
+    levels = {}
+    for level in LEVELS.levels.values():
+        levels[Path(level.tilemap_file).stem] = Level(level.tilemap_file, level.theme_file, level.mechanics, level.scaling)
+    theme_file = LEVELS[min(LEVELS.keys())].theme_file
+    for tilemap_file, mechanics in EXTRA_MAPS.items():
+        levels[Path(tilemap_file).stem] = Level(tilemap_file, theme_file, mechanics)
+    return levels
+
+
+class TimedSimulation(Simulation):
+    """Simulation that records the time of every physics step (game logic, physics and collision handlers)"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.step_times: list[float] = []
+
+    def do_physics_step(self, delta_time, resync_sprites: bool):
+        start = time.perf_counter()
+        super().do_physics_step(delta_time, resync_sprites)
+        self.step_times.append(time.perf_counter() - start)
+
+
+def setup_spawners(sim: Simulation):
+    spawners = [entity for entity in sim.entities if isinstance(entity, ItemSpawner)]
+    if not spawners:
+        sprite = arcade.Sprite(center_x=sim.start_center[0], center_y=sim.start_center[1] + 2 * SPRITE_SIZE)
+        spawner = ItemSpawner(sprite, sim.item_spawned, sim.spawnable_assets, max_scale=2, clock=lambda: sim.time)
+        sim.entities.append(spawner)
+        spawners.append(spawner)
+    for spawner in spawners:
+        spawner.active_region = None
+        spawner.spawn_interval = SPAWN_INTERVAL
+        spawner.enabled = True
+
+
+def update_blood(sim: Simulation):
+    # Killed on the next step: blood burst at the player, then the player is teleported to the start
+    if int(sim.time / KILL_INTERVAL) != int((sim.time + FRAME_DELTA_T) / KILL_INTERVAL):
+        sim.mark_player_dead = 'benchmark'
+
+
+def update_gravity(sim: Simulation):
+    angle = sim.time * GRAVITY_TURN_RATE
+    direction = np.array([np.sin(angle), -np.cos(angle)])
+    if sim.current_mechanics == MECHANICS.GRAVITY:
+        # Gravity points from the mouse to the center of the screen
+        sim.input.last_mouse_position = tuple(np.array([SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2]) - direction * 100)
+    else:
+        sim.main_gravity = direction * GRAVITY
+
+
+def update_platforms(sim: Simulation):
+    active = int(sim.time) % 2 == 1
+    angle = sim.time * PLATFORM_TURN_RATE
+    center = np.array(sim.player_sprite.position)
+    for platform, offset in ((sim.platform_left, 0), (sim.platform_right, np.pi)):
+        platform.active = active
+        if not active:
+            pos = center + PLATFORM_DISTANCE * np.array([np.cos(angle + offset), np.sin(angle + offset)])
+            sim.physics_engine.set_position(platform, tuple(pos))
+
+
+class Scenario:
+    def __init__(self, name: str, setup: Optional[Callable[[Simulation], None]] = None,
+                 updates: tuple[Callable[[Simulation], None], ...] = ()):
+        self.name = name
+        # Called after every level load
+        self.setup = setup
+        # Called before every frame
+        self.updates = updates
+
+    def update(self, sim: Simulation):
+        for update in self.updates:
+            update(sim)
+
+
+SCENARIOS = {scenario.name: scenario for scenario in [
+    Scenario('idle'),
+    Scenario('spawners', setup=setup_spawners),
+    Scenario('blood', updates=(update_blood,)),
+    Scenario('gravity', updates=(update_gravity,)),
+    Scenario('platforms', updates=(update_platforms,)),
+    Scenario('all', setup=setup_spawners, updates=(update_blood, update_gravity, update_platforms)),
+]}
+
+
+def run(level: Level, scenario: Scenario, seconds: float, seed: int = 0) -> dict:
+    """Play `seconds` of simulated time, returns the raw measurements"""
+    np.random.seed(seed)
+    random.seed(seed)
+    sim = TimedSimulation(levels=LevelRegistry({1: level}))
+    sim.handler_times = {}
+    if scenario.setup:
+        sim.on_level_loaded = lambda _: scenario.setup(sim)
+    sim.setup(load_themes=False)
+    # Loading the level is not measured
+    sim.step_times.clear()
+
+    frames = round(seconds / FRAME_DELTA_T)
+    elapsed = 0.0
+    steps = 0
+    for _ in range(frames):
+        scenario.update(sim)
+        start = time.perf_counter()
+        steps += sim.update(FRAME_DELTA_T)
+        elapsed += time.perf_counter() - start
+    return {
+        'steps': steps,
+        'elapsed': elapsed,
+        'step_times': sim.step_times,
+        'handler_times': sim.handler_times,
+    }
+
+
+def summarize(runs: list[dict]) -> dict:
+    """Median throughput of the runs, percentiles and handler times over all of their steps"""
+    step_times = np.concatenate([r['step_times'] for r in runs]) * 1000
+    steps = sum(r['steps'] for r in runs)
+    handlers = {}
+    for r in runs:
+        for key, t in r['handler_times'].items():
+            handlers[key] = handlers.get(key, 0.0) + t
+    handler_total = sum(handlers.values())
+    return {
+        'steps': steps,
+        'steps_per_second': statistics.median(r['steps'] / r['elapsed'] for r in runs),
+        'step_p50_ms': float(np.percentile(step_times, 50)),
+        'step_p99_ms': float(np.percentile(step_times, 99)),
+        'handler_ms_per_step': handler_total * 1000 / steps,
+        'handler_share': handler_total / float(np.sum(step_times) / 1000),
+        'handlers_ms_per_step': {key: t * 1000 / steps for key, t in sorted(handlers.items(), key=lambda item: -item[1]) if t},
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    import pymunk
+    return {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pymunk': pymunk.version,
+        'arcade': arcade.version.VERSION,
+        'config': {
+            'STEPS_PER_FRAME': STEPS_PER_FRAME,
+            'MERGE_STATIC_TILES': MERGE_STATIC_TILES,
+            'PHYSICS_SPATIAL_HASH': PHYSICS_SPATIAL_HASH,
+            'PHYSICS_SLEEP_TIME': PHYSICS_SLEEP_TIME,
+            'PHYSICS_INTERPOLATION': PHYSICS_INTERPOLATION,
+        },
+    }
+
+
+def print_header():
+    print(f'{"Level":<14} {"Scenario":<10} {"steps/s":>9} {"p50 [ms]":>9} {"p99 [ms]":>9} {"handlers [ms/step]":>19}')
+
+
+def print_result(result: dict):
+    print(f'{result["level"]:<14} {result["scenario"]:<10} {result["steps_per_second"]:>9.0f} '
+          f'{result["step_p50_ms"]:>9.3f} {result["step_p99_ms"]:>9.3f} '
+          f'{result["handler_ms_per_step"]:>11.3f} ({result["handler_share"]:>4.0%})')
+
+
+def command_run(args):
+    levels = benchmark_levels()
+    level_names = args.levels or list(levels)
+    scenario_names = args.scenarios or list(SCENARIOS)
+    for name in level_names:
+        if name not in levels:
+            sys.exit(f'Unknown level {name!r}, available: {", ".join(levels)}')
+    for name in scenario_names:
+        if name not in SCENARIOS:
+            sys.exit(f'Unknown scenario {name!r}, available: {", ".join(SCENARIOS)}')
+
+    results = []
+    for level_name in level_names:
+        for scenario_name in scenario_names:
+            runs = []
+            for seed in range(args.repeat):
+                level = benchmark_levels()[level_name]
+                runs.append(run(level, SCENARIOS[scenario_name], args.seconds, seed))
+            result = {'level': level_name, 'scenario': scenario_name, **summarize(runs)}
+            results.append(result)
+
+    # Loading the levels prints a lot, so the table comes at the end
+    print_header()
+    for result in results:
+        print_result(result)
+
+    if args.output:
+        data = {
+            'environment': environment(),
+            'settings': {'seconds': args.seconds, 'repeat': args.repeat},
+            'results': results,
+        }
+        Path(args.output).write_text(json.dumps(data, indent=2))
+        print(f'Results written to {args.output}')
+
+
+def command_compare(args):
+    baseline = json.loads(Path(args.baseline).read_text())
+    new = json.loads(Path(args.new).read_text())
+    baseline_results = {(r['level'], r['scenario']): r for r in baseline['results']}
+
+    print(f'Baseline: {baseline["environment"].get("commit")} ({baseline["environment"]["date"]}), '
+          f'new: {new["environment"].get("commit")} ({new["environment"]["date"]})')
+    print(f'{"Level":<14} {"Scenario":<10} {"steps/s":>17} {"change":>8} {"p99 [ms]":>15} {"handlers [ms/step]":>19}')
+    regressions = 0
+    for r in new['results']:
+        b = baseline_results.get((r['level'], r['scenario']))
+        if b is None:
+            print(f'{r["level"]:<14} {r["scenario"]:<10} (not in baseline)')
+            continue
+        change = r['steps_per_second'] / b['steps_per_second'] - 1
+        marker = ''
+        if change < -args.threshold / 100:
+            marker = ' !'
+            regressions += 1
+        print(f'{r["level"]:<14} {r["scenario"]:<10} {b["steps_per_second"]:>8.0f}→{r["steps_per_second"]:<8.0f} {change:>+8.1%} '
+              f'{b["step_p99_ms"]:>7.3f}→{r["step_p99_ms"]:<7.3f} {b["handler_ms_per_step"]:>9.3f}→{r["handler_ms_per_step"]:<9.3f}{marker}')
+    if regressions:
+        print(f'{regressions} slower by more than {args.threshold}%')
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark scripted gameplay scenarios on all levels')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument('--levels', nargs='+', metavar='LEVEL', help='Level (map file) names (default: all)')
+    run_parser.add_argument('--scenarios', nargs='+', metavar='SCENARIO', help=f'{", ".join(SCENARIOS)} (default: all)')
+    run_parser.add_argument('--seconds', type=float, default=10, help='Simulated seconds per run')
+    run_parser.add_argument('--repeat', type=int, default=3, help='Runs per level and scenario (the median throughput is reported)')
+    run_parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+    run_parser.set_defaults(func=command_run)
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=5, help='Mark throughput regressions above this many percent')
+    compare_parser.add_argument('--fail-on-regression', action='store_true', help='Exit with 1 if anything regressed')
+    compare_parser.set_defaults(func=command_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
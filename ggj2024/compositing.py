@@ -0,0 +1,97 @@
+"""Alpha compositing of premultiplied uint8 RGBA images with integer arithmetic.
+
+`utils.alpha_composite` works on floats in [0, 1] with straight alpha, which means converting images to float
+and back, copies and a division per pixel. Here images stay [y,x,c] uint8 arrays with premultiplied alpha, a
+composite is done in integers scaled by 255 * 255 (in uint32 scratch buffers that are reused between calls) and
+rounded once. The float functions stay as the reference, tests/test_compositing.py checks that both agree.
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+
+from ggj2024.utils import intersect_rect
+
+
+def div255(x: np.ndarray) -> np.ndarray:
+    """Round x / 255 in place (uint16 arrays with values up to 255 * 255)"""
+    x += 128
+    x += x >> 8
+    x >>= 8
+    return x
+
+
+def premultiply(image: np.ndarray) -> np.ndarray:
+    """Premultiplied copy of a straight alpha uint8 RGBA image"""
+    result = image.astype(np.uint16)
+    result[..., :3] *= result[..., 3:]
+    div255(result[..., :3])
+    return result.astype(np.uint8)
+
+
+def unpremultiply(image: np.ndarray) -> np.ndarray:
+    """Straight alpha copy of a premultiplied uint8 RGBA image (fully transparent pixels become black)"""
+    alpha = image[..., 3:].astype(np.uint32)
+    result = np.empty_like(image)
+    result[..., :3] = np.minimum((image[..., :3] * np.uint32(255) + alpha // 2) // np.maximum(alpha, 1), 255)
+    result[..., 3:] = image[..., 3:]
+    return result
+
+
+class Compositor:
+    """Source over compositing of premultiplied stamps onto premultiplied images. The scratch buffers grow to the
+    largest stamp and are reused, a composite allocates nothing."""
+
+    def __init__(self):
+        self._source = np.empty((0, 0, 4), dtype=np.uint32)
+        self._dest = np.empty((0, 0, 4), dtype=np.uint32)
+        self._inverse_alpha = np.empty((0, 0, 1), dtype=np.uint32)
+
+    def _scratch(self, height: int, width: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._source.shape[0] < height or self._source.shape[1] < width:
+            shape = max(height, self._source.shape[0]), max(width, self._source.shape[1])
+            self._source = np.empty(shape + (4,), dtype=np.uint32)
+            self._dest = np.empty(shape + (4,), dtype=np.uint32)
+            self._inverse_alpha = np.empty(shape + (1,), dtype=np.uint32)
+        return self._source[:height, :width], self._dest[:height, :width], self._inverse_alpha[:height, :width]
+
+    def stamp(self, dest: np.ndarray, stamp: np.ndarray, pos: tuple[int, int], mask: bool = False) \
+            -> Optional[tuple[int, int, int, int]]:
+        """Composite `stamp` over `dest` (in place) with its top left corner at `pos`. With `mask` the stamp is
+        masked with the alpha of `dest` first. Returns the changed rectangle (x1, y1, x2, y2) or None."""
+        x, y = pos
+        height, width = dest.shape[:2]
+        rect = intersect_rect((0, 0, width, height), (x, y, x + stamp.shape[1], y + stamp.shape[0]))
+        if rect is None:
+            return None
+        x1, y1, x2, y2 = rect
+        region = dest[y1:y2, x1:x2]
+        source, result, inverse_alpha = self._scratch(y2 - y1, x2 - x1)
+
+        # Everything scaled by 255 * 255: source * (dest alpha or 255)
+        source[...] = stamp[y1 - y:y2 - y, x1 - x:x2 - x]
+        source *= region[..., 3:] if mask else 255
+        # dest = source + dest * (1 - source alpha), cannot overflow since premultiplied colors are <= alpha
+        np.subtract(255 * 255, source[..., 3:], out=inverse_alpha)
+        result[...] = region
+        result *= inverse_alpha
+        source *= 255
+        result += source
+        result += 255 * 255 // 2
+        result //= 255 * 255
+        region[...] = result
+        return rect
+
+    def stamp_many(self, dest: np.ndarray, stamps: Iterable[tuple[np.ndarray, tuple[int, int]]], mask: bool = False) \
+            -> Optional[tuple[int, int, int, int]]:
+        """Composite all (stamp, pos) in order, returns the rectangle covering all changes or None"""
+        dirty = None
+        for stamp, pos in stamps:
+            rect = self.stamp(dest, stamp, pos, mask)
+            if rect is None:
+                continue
+            if dirty is None:
+                dirty = rect
+            else:
+                dirty = (min(dirty[0], rect[0]), min(dirty[1], rect[1]), max(dirty[2], rect[2]), max(dirty[3], rect[3]))
+        return dirty
+
@@ -76,12 +76,31 @@ FORCES_RELATIVE_TO_PLAYER = True
 
 # Defines how many (additionally spawned) diversifier items can exist at one time
 MAX_SPAWNED_ITEMS = 10
+# Number of pre-computed sizes between 1x and max_scale an ItemSpawner chooses from
+SPAWNABLE_SIZE_VARIANTS = 8
+# Threads used to decode spawnable item images at level load (0 = load on the main thread)
+SPAWNABLE_ASSET_LOADER_THREADS = 4
 
 FIST_THRESHOLD = 2.5
 
+# Physics steps per 1/60 s. Steps have a fixed size, a frame runs as many as needed to keep up with real time.
 STEPS_PER_FRAME = 4
+# Max. physics steps per frame. If frames take longer the game slows down instead of falling further behind.
+PHYSICS_MAX_STEPS_PER_UPDATE = 3 * STEPS_PER_FRAME
+# Draw sprites between the last two physics steps (smooth movement if the frame rate is not a multiple of 60)
+PHYSICS_INTERPOLATION = True
+
+# Merge adjacent static tiles (walls, backgrounds, ...) into box shapes instead of one body per tile
+MERGE_STATIC_TILES = True
+# Use a spatial hash instead of pymunk's bounding box tree as broadphase
+# Compare both on all levels with `python -m ggj2024.benchmarks.broadphase`
+PHYSICS_SPATIAL_HASH = False
+# Bodies that have been resting for this many seconds fall asleep until something touches them (None = never)
+PHYSICS_SLEEP_TIME = 0.5
 
 # Blood particles
+# Simulate blood particles as arrays (ggj2024.particles) instead of a ParticleSprite with a physics body each
+BLOOD_PARTICLE_SYSTEM = True
 BLOOD_PARTICLES_PER_SPLATTER = 75
 # Max. initial impulse of blood particles
 BLOOD_IMPULSE = 1000
@@ -95,10 +114,23 @@ BLOOD_PARTICLE_SIZE_RANGE = 5
 BLOOD_LIFETIME = 3
 
 BLOOD_COLOR_VARIATION = 60
+# ParticleSprites use this many shades of each red (textures are pre-rendered for every size and shade)
+BLOOD_PARTICLE_SHADES = 8
 BLOOD_PARTICLE_ANTIALIASING = 4
 BLOOD_WALL_ANTIALIASING = 4
 # Multiplier for the size of the blood splatters on the wall compared to their respective particles
 BLOOD_WALL_SIZE_MULTIPLIER = 2
+# Max. seconds per frame spent painting splatters, the rest is painted in the next frames (None = no limit)
+BLOOD_SPLATTER_FRAME_BUDGET = 0.004
+# Number of splatter shapes per size: 1 = circles only, more adds irregular blobs with droplets
+BLOOD_SPLATTER_SHAPES = 1
+# Max. number of sprites with a splatter texture and the memory of their pixels. Beyond that the least recently
+# splattered sprites get their original texture back
+BLOOD_SPLATTER_MAX_TEXTURES = 256
+BLOOD_SPLATTER_MAX_MEMORY = 128 * 1024 * 1024
+# Removed textures only give their atlas space back when the atlas is rebuilt, which is done once the removed
+# splatter textures add up to this share of the atlas
+BLOOD_SPLATTER_ATLAS_REBUILD = 0.25
 
 BLOOD_COLOR_VARIATION = 60
 BLOOD_PARTICLE_ANTIALIASING = 4
@@ -119,11 +151,25 @@ USE_LEAPMOTION = False
 MUTE_MUSIC = False
 HITSOUND_MIN_IMPULSE = 5000
 HITSOUND_RANGE = 10000
+# Number of reusable players for collision sounds
+HITSOUND_MAX_VOICES = 8
+# Only the loudest hits of a frame are played
+HITSOUND_MAX_PER_FRAME = 3
 
 # Utils
 # Epsilon to avoid zero division
 ALPHA_COMPOSITE_EPSILON = 1e-9
 
+# Level cache: compiled levels are stored here so warm starts skip parsing the Tiled maps
+LEVEL_CACHE_ENABLED = True
+LEVEL_CACHE_DIR = '.cache/levels'
+# Parsed tilesets (.tsx) are cached here
+TILESET_CACHE_ENABLED = True
+TILESET_CACHE_DIR = '.cache/tilesets'
+# Computed hit boxes are cached here
+HITBOX_CACHE_ENABLED = True
+HITBOX_CACHE_DIR = '.cache'
+
 # Debug switches. Only relevant when launching with --debug
 DEBUG_SHOW_ITEM_HITBOXES = True
 DEBUG_SHOW_PLAYER_HITBOXES = True
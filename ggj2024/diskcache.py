@@ -0,0 +1,79 @@
+"""Helpers for the on-disk caches (compiled levels, tilesets, ...).
+
+A cache file consists of a magic string, a struct header (format version, dependency block length),
+the pickled dependency block and the pickled payload. Dependencies are (path, mtime, size, hash) tuples
+of the source files. An entry stays valid as long as every source file has the same mtime or,
+if only the mtime changed, the same content hash.
+"""
+import os
+import struct
+import pickle
+import hashlib
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+
+_HEADER = struct.Struct('<HI')
+
+Dependency = tuple[str, int, int, str]
+
+
+def file_hash(path: str | Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def file_dependency(path: str | Path) -> Dependency:
+    stat = os.stat(path)
+    return str(path), stat.st_mtime_ns, stat.st_size, file_hash(path)
+
+
+def is_dependency_valid(dependency: Dependency) -> bool:
+    path, mtime, size, hash_ = dependency
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    if stat.st_mtime_ns == mtime and stat.st_size == size:
+        return True
+    # Touched but possibly unchanged (e.g. after a git checkout), fall back to the content hash
+    return stat.st_size == size and file_hash(path) == hash_
+
+
+def cache_key(*parts: Any) -> str:
+    """Short hash to distinguish cache files of the same source loaded with different parameters"""
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()[:12]
+
+
+def write_cache(cache_file: str | Path, magic: bytes, version: int, dependencies: Iterable[Dependency], payload: Any):
+    cache_file = Path(cache_file)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    dependency_block = pickle.dumps(list(dependencies), protocol=pickle.HIGHEST_PROTOCOL)
+    # Write to a temporary file first so a concurrently loading thread never sees a partial file
+    tmp_file = cache_file.with_suffix(f'.tmp{os.getpid()}')
+    with open(tmp_file, 'wb') as f:
+        f.write(magic)
+        f.write(_HEADER.pack(version, len(dependency_block)))
+        f.write(dependency_block)
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+
+def read_cache(cache_file: str | Path, magic: bytes, version: int) -> Optional[Any]:
+    """Return the payload of a cache file, or None if it does not exist or is outdated"""
+    try:
+        with open(cache_file, 'rb') as f:
+            if f.read(len(magic)) != magic:
+                return None
+            file_version, dependency_len = _HEADER.unpack(f.read(_HEADER.size))
+            if file_version != version:
+                return None
+            dependencies = pickle.loads(f.read(dependency_len))
+            if not all(is_dependency_valid(d) for d in dependencies):
+                return None
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as err:
+        print(f'WARNING: Could not read cache file {cache_file}:', err)
+        return None
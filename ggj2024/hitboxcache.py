@@ -0,0 +1,121 @@
+"""Persistent hit box cache.
+
+Computing hit boxes (especially "Detailed" ones) is slow, but they only depend on the image content,
+the cropped region, the flips and the algorithm. This module keeps them in a file in HITBOX_CACHE_DIR,
+so every hit box is computed once per asset ever instead of once per launch.
+Use `load_texture` / `load_texture_pair` instead of the arcade functions of the same name.
+Pass hit_box_algorithm="None" if the hit box is overridden anyway to skip the computation entirely.
+"""
+import atexit
+import threading
+from pathlib import Path
+from typing import Optional
+
+import arcade
+from arcade import PointList
+
+from ggj2024.config import *
+from ggj2024 import diskcache
+
+
+MAGIC = b'GGJHBX'
+FORMAT_VERSION = 1
+CACHE_FILE = Path(HITBOX_CACHE_DIR) / 'hitboxes.bin'
+
+_lock = threading.RLock()
+_hit_boxes: Optional[dict[tuple, PointList]] = None
+_textures: dict[tuple, arcade.Texture] = {}
+# (path, mtime, size) -> content hash, so every file is only hashed once per run
+_content_hashes: dict[tuple, str] = {}
+_dirty = False
+
+
+def _get_hit_boxes() -> dict[tuple, PointList]:
+    global _hit_boxes
+    if _hit_boxes is None:
+        _hit_boxes = (diskcache.read_cache(CACHE_FILE, MAGIC, FORMAT_VERSION) if HITBOX_CACHE_ENABLED else None) or {}
+    return _hit_boxes
+
+
+def _content_hash(file_name: str | Path) -> str:
+    stat = Path(file_name).stat()
+    stat_key = (str(file_name), stat.st_mtime_ns, stat.st_size)
+    content_hash = _content_hashes.get(stat_key)
+    if content_hash is None:
+        content_hash = _content_hashes[stat_key] = diskcache.file_hash(file_name)
+    return content_hash
+
+
+def save():
+    """Write the cache to disk if new hit boxes were computed. Also called at exit."""
+    global _dirty
+    with _lock:
+        if not _dirty or not HITBOX_CACHE_ENABLED:
+            return
+        try:
+            diskcache.write_cache(CACHE_FILE, MAGIC, FORMAT_VERSION, [], _hit_boxes)
+            _dirty = False
+        except OSError as err:
+            print(f'WARNING: Could not write hit box cache {CACHE_FILE}:', err)
+
+
+def _calculate_hit_box(texture: arcade.Texture, hit_box_algorithm: str, hit_box_detail: float) -> PointList:
+    if hit_box_algorithm == 'Detailed':
+        return arcade.calculate_hit_box_points_detailed(texture.image, hit_box_detail)
+    return arcade.calculate_hit_box_points_simple(texture.image)
+
+
+def load_texture(file_name: str | Path,
+                 x: float = 0,
+                 y: float = 0,
+                 width: float = 0,
+                 height: float = 0,
+                 flipped_horizontally: bool = False,
+                 flipped_vertically: bool = False,
+                 flipped_diagonally: bool = False,
+                 hit_box_algorithm: Optional[str] = 'Simple',
+                 hit_box_detail: float = 4.5) -> arcade.Texture:
+    """Same as `arcade.load_texture`, but the hit box is taken from the persistent cache"""
+    global _dirty
+    if hit_box_algorithm not in ('Simple', 'Detailed'):
+        # Nothing to compute, arcade will just use the image's bounding box
+        return arcade.load_texture(file_name, x, y, width, height,
+                                   flipped_horizontally=flipped_horizontally,
+                                   flipped_vertically=flipped_vertically,
+                                   flipped_diagonally=flipped_diagonally,
+                                   hit_box_algorithm='None')
+
+    key = (_content_hash(file_name), x, y, width, height,
+           flipped_horizontally, flipped_vertically, flipped_diagonally,
+           hit_box_algorithm, hit_box_detail if hit_box_algorithm == 'Detailed' else None)
+    with _lock:
+        texture = _textures.get(key)
+        if texture is not None:
+            return texture
+
+    # Not cached by arcade: textures with different hit boxes for the same image region must not be shared
+    texture = arcade.load_texture(file_name, x, y, width, height,
+                                  flipped_horizontally=flipped_horizontally,
+                                  flipped_vertically=flipped_vertically,
+                                  flipped_diagonally=flipped_diagonally,
+                                  can_cache=False,
+                                  hit_box_algorithm='None')
+    with _lock:
+        hit_boxes = _get_hit_boxes()
+        points = hit_boxes.get(key)
+        if points is None:
+            points = hit_boxes[key] = _calculate_hit_box(texture, hit_box_algorithm, hit_box_detail)
+            if not _dirty:
+                _dirty = True
+                atexit.register(save)
+        texture._hit_box_points = points
+        _textures[key] = texture
+    return texture
+
+
+def load_texture_pair(file_name: str | Path, hit_box_algorithm: Optional[str] = 'Simple', hit_box_detail: float = 4.5) -> list[arcade.Texture]:
+    """Same as `arcade.load_texture_pair`: the texture and its horizontally mirrored version"""
+    return [
+        load_texture(file_name, hit_box_algorithm=hit_box_algorithm, hit_box_detail=hit_box_detail),
+        load_texture(file_name, flipped_horizontally=True, hit_box_algorithm=hit_box_algorithm, hit_box_detail=hit_box_detail),
+    ]
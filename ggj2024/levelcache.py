@@ -0,0 +1,208 @@
+"""Compiled level cache.
+
+Parsing a Tiled map (JSON + the referenced .tsx tilesets) and creating every tile sprite with its
+properties and hit box is slow. This module compiles what `GameWindow.load_level` consumes into a
+compact binary file and rebuilds the sprite lists from it on later starts without touching JSON or XML.
+
+The payload holds numpy arrays for positions, sizes and hit boxes plus deduplicated texture and property
+tables. It is stored with `ggj2024.diskcache`, depending on the map, its tilesets and images.
+
+Precompile all levels with `python -m ggj2024.levelcache resources/tiled_maps/*.json`
+"""
+import os
+import json
+import pickle
+import argparse
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+import arcade
+from arcade.arcade_types import TiledObject
+from arcade.tilemap.tilemap import TileMap, _get_image_info_from_tileset, _get_image_source
+
+from ggj2024.config import *
+from ggj2024 import diskcache
+
+
+MAGIC = b'GGJLVL'
+# Bump this whenever the payload layout or the compile logic changes
+FORMAT_VERSION = 1
+
+
+class _RecordingTileMap(TileMap):
+    """TileMap that remembers the texture region every sprite was created from"""
+
+    def _create_sprite_from_tile(self, tile, scaling=1.0, hit_box_algorithm="Simple", hit_box_detail=4.5,
+                                 custom_class=None, custom_class_args={}):
+        if tile.animation:
+            raise ValueError(f'Animated tiles can not be compiled (tile {tile.id})')
+        sprite = super()._create_sprite_from_tile(tile, scaling, hit_box_algorithm, hit_box_detail,
+                                                  custom_class, custom_class_args)
+        image_file = _get_image_source(tile, os.path.dirname(self.tiled_map.map_file))
+        image_x, image_y, width, height = _get_image_info_from_tileset(tile)
+        sprite.texture_ref = (str(image_file), int(image_x), int(image_y), int(width), int(height),
+                              bool(tile.flipped_horizontally), bool(tile.flipped_vertically), bool(tile.flipped_diagonally))
+        return sprite
+
+
+class CompiledTileMap:
+    """The parts of an `arcade.TileMap` that are used by the game, rebuilt from a compiled level"""
+
+    def __init__(self, payload: dict[str, Any]):
+        self.width: int = payload['width']
+        self.height: int = payload['height']
+        self.tile_width: int = payload['tile_width']
+        self.tile_height: int = payload['tile_height']
+        self.scaling: float = payload['scaling']
+        self.sprite_lists: dict[str, arcade.SpriteList] = OrderedDict()
+        self.object_lists: dict[str, list[TiledObject]] = OrderedDict()
+
+        textures = [arcade.load_texture(file, x, y, w, h,
+                                        flipped_horizontally=fh,
+                                        flipped_vertically=fv,
+                                        flipped_diagonally=fd,
+                                        hit_box_algorithm='None')
+                    for file, x, y, w, h, fh, fv, fd in payload['textures']]
+        properties = payload['properties']
+
+        for name, layer in payload['layers']:
+            sprite_list = arcade.SpriteList()
+            offsets = layer['hit_box_offsets']
+            hit_box_points = layer['hit_box_points'].tolist()
+            for i, (x, y, angle) in enumerate(layer['transform'].tolist()):
+                sprite = arcade.Sprite(texture=textures[layer['texture'][i]], scale=self.scaling)
+                sprite.width, sprite.height = layer['size'][i].tolist()
+                sprite.position = x, y
+                sprite.angle = angle
+                alpha = int(layer['alpha'][i])
+                if alpha != 255:
+                    sprite.alpha = alpha
+                sprite.properties = dict(properties[layer['properties'][i]])
+                sprite.hit_box = [tuple(p) for p in hit_box_points[offsets[i]:offsets[i+1]]]
+                sprite_list.append(sprite)
+            sprite_list.visible = layer['visible']
+            self.sprite_lists[name] = sprite_list
+
+        for name, objects in payload['objects']:
+            self.object_lists[name] = [TiledObject(shape, props, obj_name, obj_type)
+                                       for shape, props, obj_name, obj_type in objects]
+
+
+def compile_tilemap(tile_map: _RecordingTileMap) -> dict[str, Any]:
+    """Extract everything the game needs from a loaded tilemap into a picklable payload"""
+    textures: dict[tuple, int] = {}
+    properties: list[dict] = []
+    property_index: dict[bytes, int] = {}
+
+    layers = []
+    for name, sprite_list in tile_map.sprite_lists.items():
+        n = len(sprite_list)
+        layer = {
+            'transform': np.empty((n, 3), dtype='float32'),
+            'size': np.empty((n, 2), dtype='float32'),
+            'alpha': np.empty(n, dtype='uint8'),
+            'texture': np.empty(n, dtype='int32'),
+            'properties': np.empty(n, dtype='int32'),
+            'hit_box_offsets': np.zeros(n + 1, dtype='int32'),
+            'visible': sprite_list.visible,
+        }
+        hit_boxes = []
+        for i, sprite in enumerate(sprite_list):
+            layer['transform'][i] = sprite.center_x, sprite.center_y, sprite.angle
+            layer['size'][i] = sprite.width, sprite.height
+            layer['alpha'][i] = sprite.alpha
+            layer['texture'][i] = textures.setdefault(sprite.texture_ref, len(textures))
+            # Tiles of the same kind share their properties, only store each distinct dict once
+            key = pickle.dumps(sorted(sprite.properties.items()))
+            if key not in property_index:
+                property_index[key] = len(properties)
+                properties.append(dict(sprite.properties))
+            layer['properties'][i] = property_index[key]
+            hit_box = sprite.get_hit_box()
+            hit_boxes.extend(hit_box)
+            layer['hit_box_offsets'][i + 1] = layer['hit_box_offsets'][i] + len(hit_box)
+        layer['hit_box_points'] = np.array(hit_boxes, dtype='float32').reshape(-1, 2)
+        layers.append((name, layer))
+
+    objects = [(name, [(obj.shape, obj.properties, obj.name, obj.type) for obj in object_list])
+               for name, object_list in tile_map.object_lists.items()]
+
+    return {
+        'width': tile_map.width,
+        'height': tile_map.height,
+        'tile_width': tile_map.tile_width,
+        'tile_height': tile_map.tile_height,
+        'scaling': tile_map.scaling,
+        'textures': list(textures.keys()),
+        'properties': properties,
+        'layers': layers,
+        'objects': objects,
+    }
+
+
+def _collect_dependencies(map_file: str | Path, payload: dict[str, Any]) -> list[diskcache.Dependency]:
+    map_file = Path(map_file)
+    files = [map_file]
+    with open(map_file) as f:
+        raw_map = json.load(f)
+    for tileset in raw_map.get('tilesets', []):
+        if 'source' in tileset:
+            files.append(map_file.parent / tileset['source'])
+    files.extend(Path(texture_ref[0]) for texture_ref in payload['textures'])
+    return [diskcache.file_dependency(f) for f in dict.fromkeys(files)]
+
+
+def get_cache_file(map_file: str | Path, scaling: float) -> Path:
+    key = diskcache.cache_key(Path(map_file).resolve(), scaling)
+    return Path(LEVEL_CACHE_DIR) / f'{Path(map_file).stem}.{key}.lvl'
+
+
+def compile_level(map_file: str | Path, scaling: float) -> dict[str, Any]:
+    """Parse a Tiled map and write its compiled form to the cache. Returns the payload."""
+    payload = compile_tilemap(_RecordingTileMap(map_file, scaling))
+    diskcache.write_cache(get_cache_file(map_file, scaling), MAGIC, FORMAT_VERSION,
+                          _collect_dependencies(map_file, payload), payload)
+    return payload
+
+
+def read_tilemap(map_file: str | Path, scaling: float) -> Optional[dict[str, Any]]:
+    """The compiled level from the cache (None if it is not cached). Only reads files, safe on any thread."""
+    if not LEVEL_CACHE_ENABLED:
+        return None
+    return diskcache.read_cache(get_cache_file(map_file, scaling), MAGIC, FORMAT_VERSION)
+
+
+def load_tilemap(map_file: str | Path, scaling: float, payload: Optional[dict[str, Any]] = None) \
+        -> CompiledTileMap | arcade.TileMap:
+    """Drop-in replacement for `arcade.load_tilemap` that goes through the compiled level cache.
+    Pass the `payload` if it was read already (read_tilemap). Creates sprite lists (and with a window OpenGL
+    buffers), so call it on the main thread."""
+    if not LEVEL_CACHE_ENABLED:
+        return arcade.load_tilemap(map_file, scaling)
+    if payload is None:
+        payload = read_tilemap(map_file, scaling)
+    if payload is None:
+        try:
+            payload = compile_level(map_file, scaling)
+        except Exception as err:
+            print(f'WARNING: Could not compile level {map_file}, loading it without cache:', err)
+            return arcade.load_tilemap(map_file, scaling)
+    return CompiledTileMap(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile Tiled maps into the level cache')
+    parser.add_argument('maps', nargs='+', help='Tiled map (.json) files')
+    parser.add_argument('--scaling', type=float, default=SPRITE_SCALING_TILES)
+    args = parser.parse_args()
+    for map_file in args.maps:
+        payload = compile_level(map_file, args.scaling)
+        n_sprites = sum(len(layer['texture']) for _, layer in payload['layers'])
+        print(f'{map_file}: {n_sprites} sprites, {len(payload["textures"])} textures -> {get_cache_file(map_file, args.scaling)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Level registry. Tilemaps and themes are only parsed when a level is actually used,
+the level that comes next is prefetched in the background while the current one is played.
+Prefetching only reads files (compiled level, theme). Sprite lists create OpenGL buffers as soon as a window
+exists, so the tilemap is always built on the main thread, when the level is loaded."""
+import threading
+from enum import Enum
+from typing import Iterator, Optional
+
+import arcade
+
+from ggj2024.config import *
+from ggj2024 import levelcache
+from ggj2024.profiling import PROFILER
+
+
+class MECHANICS(Enum):
+    PLATFORMS = 1
+    GRAVITY = 2
+
+
+class Level:
+    """A single level. The tilemap and theme are loaded on first access (or by `load()`)."""
+
+    def __init__(self, tilemap_file: str, theme_file: str, mechanics: MECHANICS, scaling: float = SPRITE_SCALING_TILES):
+        self.tilemap_file = tilemap_file
+        self.theme_file = theme_file
+        self.mechanics = mechanics
+        self.scaling = scaling
+        self._tilemap: Optional[arcade.TileMap | levelcache.CompiledTileMap] = None
+        self._theme: Optional[arcade.Sound] = None
+        # Compiled tilemap read by a prefetch, turned into sprite lists by load()
+        self._payload: Optional[dict] = None
+        # Guards loading/unloading, so the main thread waits for a running prefetch instead of loading twice
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._tilemap is not None and self._theme is not None
+
+    @property
+    def tilemap(self) -> arcade.TileMap | levelcache.CompiledTileMap:
+        if self._tilemap is None:
+            self.load()
+        return self._tilemap
+
+    @property
+    def theme(self) -> arcade.Sound:
+        if self._theme is None:
+            self.load()
+        return self._theme
+
+    def needs_loading(self, load_theme: bool = True) -> bool:
+        return self._tilemap is None or (load_theme and self._theme is None)
+
+    def needs_fetching(self, load_theme: bool = True) -> bool:
+        return (self._tilemap is None and self._payload is None) or (load_theme and self._theme is None)
+
+    def load(self, load_theme: bool = True):
+        """Parse the tilemap and (unless `load_theme` is False, e.g. without audio) the theme.
+        Creates sprite lists, so only call it on the main thread."""
+        with self._lock:
+            if self._tilemap is None:
+                with PROFILER.section(f'load tilemap {self.tilemap_file}'):
+                    self._tilemap = levelcache.load_tilemap(self.tilemap_file, self.scaling, self._payload)
+                self._payload = None
+            self._load_theme(load_theme)
+
+    def fetch(self, load_theme: bool = True):
+        """Read the compiled tilemap (if it is cached) and the theme. Creates no sprites or textures, so it can
+        run on a worker thread."""
+        with self._lock:
+            if self._tilemap is None and self._payload is None:
+                with PROFILER.section(f'read tilemap {self.tilemap_file}'):
+                    self._payload = levelcache.read_tilemap(self.tilemap_file, self.scaling)
+            self._load_theme(load_theme)
+
+    def _load_theme(self, load_theme: bool):
+        if load_theme and self._theme is None:
+            with PROFILER.section(f'load theme {self.theme_file}'):
+                self._theme = arcade.load_sound(self.theme_file, False)
+
+    def unload(self):
+        """Drop the parsed tilemap and theme. They will be loaded again on next access."""
+        with self._lock:
+            self._tilemap = None
+            self._theme = None
+            self._payload = None
+
+    def __repr__(self):
+        return f'Level({self.tilemap_file!r}, loaded={self.is_loaded})'
+
+
+class LevelRegistry:
+    """Maps level ids to levels and keeps only the active and the upcoming level in memory."""
+
+    def __init__(self, levels: dict[int, Level]):
+        self.levels = levels
+        self.active_id: Optional[int] = None
+        self._prefetch_thread: Optional[threading.Thread] = None
+
+    def __getitem__(self, level_id: int) -> Level:
+        return self.levels[level_id]
+
+    def __contains__(self, level_id: int) -> bool:
+        return level_id in self.levels
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.levels)
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def keys(self):
+        return self.levels.keys()
+
+    def next_level(self, level_id: int) -> int:
+        """Id of the level following `level_id` (wraps around after the last one)"""
+        available_levels = list(sorted(self.levels.keys()))
+        next_index = (available_levels.index(level_id) + 1) % len(available_levels)
+        return available_levels[next_index]
+
+    def activate(self, level_id: int, load_theme: bool = True) -> Level:
+        """Make `level_id` the active level: load it (or wait for its prefetch), unload every level
+        that is neither active nor next and start prefetching the next one."""
+        level = self.levels[level_id]
+        level.load(load_theme)
+        self.active_id = level_id
+
+        next_id = self.next_level(level_id)
+        for other_id, other in self.levels.items():
+            if other_id not in (level_id, next_id) and \
+                    (other._tilemap is not None or other._theme is not None or other._payload is not None):
+                other.unload()
+        if next_id != level_id:
+            self.prefetch(next_id, load_theme)
+        return level
+
+    def prefetch(self, level_id: int, load_theme: bool = True):
+        """Read the files of a level on a worker thread (see Level.fetch)"""
+        level = self.levels[level_id]
+        if not level.needs_fetching(load_theme):
+            return
+
+        def _prefetch():
+            try:
+                level.fetch(load_theme)
+            except Exception as err:
+                # Not fatal, the level will be loaded (and the error raised) again when it is activated
+                print(f'WARNING: Prefetching level {level_id} failed:', err)
+
+        self._prefetch_thread = threading.Thread(target=_prefetch, name=f'prefetch-level-{level_id}', daemon=True)
+        self._prefetch_thread.start()
+
+
+LEVELS = LevelRegistry({
+    1: Level("resources/tiled_maps/Level1.json", 'resources/sound/theme_calm.mp3', MECHANICS.PLATFORMS),
+    2: Level("resources/tiled_maps/Level2.json", 'resources/sound/theme_fast.mp3', MECHANICS.GRAVITY),
+    3: Level("resources/tiled_maps/Level3.json", 'resources/sound/theme.mp3', MECHANICS.PLATFORMS),
+    4: Level("resources/tiled_maps/PitOfDoom.json", 'resources/sound/theme_fast.mp3', MECHANICS.GRAVITY),
+})
@@ -0,0 +1,247 @@
+"""Blood particles as NumPy arrays instead of sprites with physics bodies.
+
+A `ParticleSprite` has its own pymunk body and shape, arcade sprite and texture, which limits a splatter to
+a few dozen particles. `BloodParticleSystem` stores all particles in arrays (struct of arrays) and moves
+them in one vectorized pass per step. Particles only collide with the level, so impacts are found with a
+grid of the static geometry and the bounding boxes of the items, only particles that are close to a shape
+are checked exactly (with a pymunk point query). `BloodParticleRenderer` draws all of them in one call.
+"""
+from typing import NamedTuple, Optional
+
+import arcade
+import arcade.gl
+import numpy as np
+import pymunk
+
+from ggj2024.config import *
+from ggj2024.physics_engine import PhysicsEngine
+
+
+class Impact(NamedTuple):
+    """A particle that hit the level (and was removed)"""
+    point: pymunk.Vec2d
+    velocity: pymunk.Vec2d
+    radius: float
+    color: tuple[int, int, int]
+
+
+class BloodParticleSystem:
+    """Blood particles of a level. Particles fly until they touch a wall, soft tile, finish, item or background
+    (every other particle ignores backgrounds, so the grass won't catch all the blood) or their lifetime ends.
+    The finish stops particles (like the physics bodies of ParticleSprite) but is not painted itself.
+    """
+
+    # Flags of the cells of the static geometry grid
+    SOLID = 1
+    BACKGROUND = 2
+
+    def __init__(self, physics_engine: PhysicsEngine, cell_size: float, capacity: int = 1024):
+        self.physics_engine = physics_engine
+        self.count = 0
+        self.position = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.radius = np.zeros(capacity)
+        self.color = np.zeros((capacity, 4), dtype=np.uint8)
+        self.death_time = np.zeros(capacity)
+        self.ignore_background = np.zeros(capacity, dtype=bool)
+
+        self.filter = physics_engine.make_shapefilter(['wall', 'soft', 'finish', 'item', 'background'], categories='particle')
+        self.filter_ignore_background = physics_engine.make_shapefilter(['wall', 'soft', 'finish', 'item'], categories='particle')
+        self.cell_size = cell_size
+        self._build_grid()
+
+    def _build_grid(self):
+        """Mark the cells that are close enough to a static shape that a particle in them could touch it"""
+        engine = self.physics_engine
+        solid = engine.collision_mask(['wall', 'soft', 'finish'])
+        background = engine.collision_mask('background')
+        margin = BLOOD_PARTICLE_SIZE_MIN + BLOOD_PARTICLE_SIZE_RANGE
+        boxes = []
+        for shape in engine.space.static_body.shapes:
+            flags = (self.SOLID if shape.filter.categories & solid else 0) | (self.BACKGROUND if shape.filter.categories & background else 0)
+            if flags:
+                bb = shape.cache_bb()
+                boxes.append((bb.left - margin, bb.bottom - margin, bb.right + margin, bb.top + margin, flags))
+        if not boxes:
+            self.grid = np.zeros((0, 0), dtype=np.uint8)
+            self.grid_origin = np.zeros(2)
+            return
+        boxes = np.array(boxes)
+        self.grid_origin = boxes[:, :2].min(axis=0)
+        cells = np.floor((boxes[:, :4] - np.tile(self.grid_origin, 2)) / self.cell_size).astype(int)
+        cols, rows = cells[:, 2:].max(axis=0) + 1
+        self.grid = np.zeros((rows, cols), dtype=np.uint8)
+        for (x1, y1, x2, y2), flags in zip(cells, boxes[:, 4].astype(np.uint8)):
+            self.grid[y1:y2 + 1, x1:x2 + 1] |= flags
+
+    def _reserve(self, count: int):
+        capacity = len(self.radius)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        for name in ('position', 'velocity', 'radius', 'color', 'death_time', 'ignore_background'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def spawn(self, position: tuple[float, float], count: int, time: float, mass: float = 0.5):
+        """Burst of `count` particles flying apart from `position`"""
+        self._reserve(self.count + count)
+        new = slice(self.count, self.count + count)
+        self.position[new] = position
+        self.velocity[new] = (np.random.rand(count, 2) - .5) * BLOOD_IMPULSE / mass
+        self.radius[new] = np.random.rand(count) * BLOOD_PARTICLE_SIZE_RANGE + BLOOD_PARTICLE_SIZE_MIN
+        # Dark red or light red, like ParticleSprite
+        color_var = (np.random.randint(BLOOD_PARTICLE_SHADES, size=count) * BLOOD_COLOR_VARIATION // BLOOD_PARTICLE_SHADES).astype(np.uint8)
+        dark = np.random.rand(count) < 0.5
+        self.color[new, 0] = np.where(dark, 255 - color_var, 255)
+        self.color[new, 1] = self.color[new, 2] = np.where(dark, 0, color_var)
+        self.color[new, 3] = 255
+        self.death_time[new] = time + BLOOD_LIFETIME
+        self.ignore_background[new] = np.random.rand(count) > 0.5
+        self.count += count
+
+    def remove(self, mask: np.ndarray):
+        """Remove the particles where `mask` (of length count) is True"""
+        keep = np.flatnonzero(~mask)
+        if len(keep) == self.count:
+            return
+        for array in (self.position, self.velocity, self.radius, self.color, self.death_time, self.ignore_background):
+            array[:len(keep)] = array[keep]
+        self.count = len(keep)
+
+    def expire(self, time: float):
+        if self.count:
+            self.remove(self.death_time[:self.count] <= time)
+
+    def step(self, delta_time: float, gravity: tuple[float, float], obstacles: list[pymunk.Shape]) -> list[Impact]:
+        """Move all particles, remove the ones that hit something and return their impacts.
+        `obstacles` are the (moving) item shapes, the static shapes are taken from the grid.
+        """
+        n = self.count
+        if not n:
+            return []
+        position = self.position[:n]
+        velocity = self.velocity[:n]
+        radius = self.radius[:n]
+        # Same order as Chipmunk: position with the old velocity, then velocity with damping and gravity
+        position += velocity * delta_time
+        velocity *= self.physics_engine.space.damping ** delta_time
+        velocity += np.asarray(gravity) * delta_time
+
+        candidates = self._near_static(position, self.ignore_background[:n])
+        if obstacles:
+            bbs = np.array([tuple(shape.bb) for shape in obstacles])
+            x, y, r = position[:, 0:1], position[:, 1:2], radius[:, None]
+            candidates |= ((x >= bbs[:, 0] - r) & (x <= bbs[:, 2] + r) &
+                           (y >= bbs[:, 1] - r) & (y <= bbs[:, 3] + r)).any(axis=1)
+
+        impacts = []
+        hit = np.zeros(n, dtype=bool)
+        space = self.physics_engine.space
+        for i in np.flatnonzero(candidates).tolist():
+            shape_filter = self.filter_ignore_background if self.ignore_background[i] else self.filter
+            info = space.point_query_nearest(tuple(position[i]), radius[i], shape_filter)
+            if info is not None:
+                hit[i] = True
+                impacts.append(Impact(info.point, pymunk.Vec2d(*velocity[i]), float(radius[i]), tuple(self.color[i, :3].tolist())))
+        if impacts:
+            self.remove(hit)
+        return impacts
+
+    def _near_static(self, position: np.ndarray, ignore_background: np.ndarray) -> np.ndarray:
+        rows, cols = self.grid.shape
+        cells = np.floor((position - self.grid_origin) / self.cell_size)
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < cols) & (cells[:, 1] >= 0) & (cells[:, 1] < rows)
+        flags = np.zeros(len(position), dtype=np.uint8)
+        cells = cells[inside].astype(np.intp)
+        flags[inside] = self.grid[cells[:, 1], cells[:, 0]]
+        return ((flags & self.SOLID) != 0) | (((flags & self.BACKGROUND) != 0) & ~ignore_background)
+
+
+class BloodParticleRenderer:
+    """Draws all particles of a BloodParticleSystem in one call (antialiased circles, one point per particle)"""
+
+    VERTEX_SHADER = """
+        #version 330
+        in vec2 in_pos;
+        in float in_radius;
+        in vec4 in_color;
+        out float v_radius;
+        out vec4 v_color;
+        void main() {
+            gl_Position = vec4(in_pos, 0.0, 1.0);
+            v_radius = in_radius;
+            v_color = in_color;
+        }
+    """
+    GEOMETRY_SHADER = """
+        #version 330
+        layout (points) in;
+        layout (triangle_strip, max_vertices = 4) out;
+        uniform Projection {
+            uniform mat4 matrix;
+        } proj;
+        in float v_radius[];
+        in vec4 v_color[];
+        out vec2 g_uv;
+        out vec4 g_color;
+        void main() {
+            vec2 center = gl_in[0].gl_Position.xy;
+            for (int i = 0; i < 4; i++) {
+                vec2 uv = vec2(i % 2, i / 2) * 2.0 - 1.0;
+                gl_Position = proj.matrix * vec4(center + uv * v_radius[0], 0.0, 1.0);
+                g_uv = uv;
+                g_color = v_color[0];
+                EmitVertex();
+            }
+            EndPrimitive();
+        }
+    """
+    FRAGMENT_SHADER = """
+        #version 330
+        in vec2 g_uv;
+        in vec4 g_color;
+        out vec4 f_color;
+        void main() {
+            float d = length(g_uv);
+            float alpha = 1.0 - smoothstep(1.0 - fwidth(d), 1.0, d);
+            if (alpha <= 0.0)
+                discard;
+            f_color = vec4(g_color.rgb, g_color.a * alpha);
+        }
+    """
+
+    def __init__(self, ctx: arcade.ArcadeContext, capacity: int = 1024):
+        self.ctx = ctx
+        self.program = ctx.program(vertex_shader=self.VERTEX_SHADER,
+                                   geometry_shader=self.GEOMETRY_SHADER,
+                                   fragment_shader=self.FRAGMENT_SHADER)
+        self.capacity = 0
+        self.geometry: Optional[arcade.gl.Geometry] = None
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.capacity = capacity
+        self.vertex_buffer = self.ctx.buffer(reserve=capacity * 3 * 4)
+        self.color_buffer = self.ctx.buffer(reserve=capacity * 4)
+        self.geometry = self.ctx.geometry([
+            arcade.gl.BufferDescription(self.vertex_buffer, '2f 1f', ['in_pos', 'in_radius']),
+            arcade.gl.BufferDescription(self.color_buffer, '4f1', ['in_color'], normalized=['in_color']),
+        ])
+
+    def draw(self, particles: BloodParticleSystem):
+        n = particles.count
+        if not n:
+            return
+        if n > self.capacity:
+            self._allocate(max(n, self.capacity * 2))
+        vertices = np.empty((n, 3), dtype=np.float32)
+        vertices[:, :2] = particles.position[:n]
+        vertices[:, 2] = particles.radius[:n]
+        self.vertex_buffer.write(vertices.tobytes())
+        self.color_buffer.write(particles.color[:n].tobytes())
+        self.ctx.enable(self.ctx.BLEND)
+        self.geometry.render(self.program, mode=self.ctx.POINTS, vertices=n)
@@ -1,6 +1,7 @@
 import logging
 from typing import Callable, Iterable, Optional, Any, Union, Tuple, Dict, List
 import math
+import time
 import numpy as np
 
 from pyglet.math import Vec2
@@ -8,10 +9,82 @@ import pymunk
 import arcade
 from arcade import PymunkPhysicsObject, Sprite
 
+from ggj2024.staticgeometry import TileBlock, merge_box_tiles
+
 
 LOG = logging.getLogger(__name__)
 
 
+class VelocityLimits:
+    """
+    Maximum velocities of a set of bodies, clamped in one vectorized pass after each physics step.
+
+    This is not the same as arcade's velocity callback: that clamps inside the integration, before the contact
+    solver, so contacts could still push a body past its limit for a step. Here the clamp comes after the solver,
+    so a body never moves faster than its limit, but trajectories with contacts differ from the callback version.
+    The vertical limit is max_vertical_velocity, arcade's callback clamped the vertical velocity to the
+    horizontal maximum.
+
+    A limit of 0 or None means "no limit" (same as for arcade.PymunkPhysicsEngine).
+    """
+
+    def __init__(self):
+        self.bodies: list[pymunk.Body] = []
+        self._index: dict[pymunk.Body, int] = {}
+        # max. speed, max. |vx| and max. |vy| of every body
+        self._limits = np.empty((0, 3))
+
+    def __len__(self) -> int:
+        return len(self.bodies)
+
+    def set(self, body: pymunk.Body, max_velocity: Optional[float] = None,
+            max_horizontal_velocity: Optional[float] = None, max_vertical_velocity: Optional[float] = None):
+        limits = [limit if limit else np.inf for limit in (max_velocity, max_horizontal_velocity, max_vertical_velocity)]
+        if all(limit == np.inf for limit in limits):
+            self.remove(body)
+            return
+        i = self._index.get(body)
+        if i is None:
+            self._index[body] = len(self.bodies)
+            self.bodies.append(body)
+            self._limits = np.vstack((self._limits, limits))
+        else:
+            self._limits[i] = limits
+
+    def remove(self, body: pymunk.Body):
+        i = self._index.pop(body, None)
+        if i is None:
+            return
+        # Move the last body into the gap
+        last = self.bodies.pop()
+        if i < len(self.bodies):
+            self.bodies[i] = last
+            self._index[last] = i
+            self._limits[i] = self._limits[-1]
+        self._limits = self._limits[:-1]
+
+    def apply(self):
+        """Clamp the velocities of all bodies to their limits"""
+        if not self.bodies:
+            return
+        velocity = np.array([body.velocity for body in self.bodies], dtype=float)
+        max_speed, max_vx, max_vy = self._limits.T
+
+        # Same order as arcade's velocity callback: total speed first, then the single axes
+        clamped = velocity.copy()
+        speed = np.sqrt(velocity[:, 0]**2 + velocity[:, 1]**2)
+        too_fast = speed > max_speed
+        if too_fast.any():
+            clamped[too_fast] *= (max_speed[too_fast] / speed[too_fast])[:, None]
+        np.clip(clamped[:, 0], -max_vx, max_vx, out=clamped[:, 0])
+        # arcade clamped vy to the horizontal maximum here, this uses the vertical one
+        np.clip(clamped[:, 1], -max_vy, max_vy, out=clamped[:, 1])
+
+        # Only write back what actually changed, usually nothing
+        for i in np.flatnonzero((clamped != velocity).any(axis=1)).tolist():
+            self.bodies[i].velocity = tuple(clamped[i].tolist())
+
+
 class PhysicsEngine(arcade.PymunkPhysicsEngine):
     """
     GGJ2024 Physics Engine: extension of arcade.PymunkPhysicsEngine with some extra features and optimizations.
@@ -21,15 +94,32 @@ class PhysicsEngine(arcade.PymunkPhysicsEngine):
                     while 0.9 has 10% loss of speed etc.
     :param maximum_incline_on_ground: The maximum incline the ground can have, before is_on_ground() becomes False
         default = 0.708 or a little bit over 45° angle
+    :param handler_times: If given, the time spent in every collision handler is added to it (in seconds, keyed
+        by "first_type/second_type:kind"). Used by the benchmarks, costs two clock reads per call.
     """
 
     # pymunk is built upon Chipmunk which only supports upto 32 collision categories
     MAX_COLLISION_CATEGORY = 1 << 32
+    # Size of the spatial hash table per shape, pymunk recommends ~10x the number of objects
+    SPATIAL_HASH_COUNT_PER_SHAPE = 10
 
-    def __init__(self, gravity=(0, 0), damping: float = 1.0, maximum_incline_on_ground: float = 0.708):
+    def __init__(self, gravity=(0, 0), damping: float = 1.0, maximum_incline_on_ground: float = 0.708,
+                 handler_times: Optional[dict[str, float]] = None):
         super().__init__(gravity, damping, maximum_incline_on_ground)
+        self.handler_times = handler_times
         self.collision_types: dict[str, int] = {}
         self.next_collision_category: int = 1
+        self.velocity_limits = VelocityLimits()
+        # Reverse index of self.sprites, collision handlers look up the sprites of every arbiter
+        self.shape_sprites: dict[pymunk.Shape, Sprite] = {}
+        # Merged static tiles (see add_static_sprite_list), shapes of blocks are not in shape_sprites
+        self.shape_blocks: dict[pymunk.Shape, TileBlock] = {}
+        self.tile_blocks: dict[Sprite, TileBlock] = {}
+        # Body positions and angles before the last step (see save_state and resync_sprites)
+        self.previous_state: dict[Sprite, tuple[pymunk.Vec2d, float]] = {}
+        # Memoized masks and shape filters (see collision_mask and collision_filter), cleared when a collision type is added
+        self._mask_cache: dict[tuple[str, ...], int] = {}
+        self._filter_cache: dict[tuple, pymunk.ShapeFilter] = {}
     
 
     def add_sprite(self,
@@ -112,9 +202,9 @@ class PhysicsEngine(arcade.PymunkPhysicsEngine):
         body.position = pymunk.Vec2d(sprite.center_x, sprite.center_y)
         body.angle = math.radians(sprite.angle)
 
-        # Callback used if we need custom gravity, damping, velocity, etc.
+        # Callback used if we need custom gravity or damping
         def velocity_callback(my_body, my_gravity, my_damping, dt):
-            """ Used for custom damping, gravity, and max_velocity. """
+            """ Used for custom damping and gravity. """
 
             # Custom damping
             if sprite.pymunk.damping is not None:
@@ -129,33 +219,16 @@ class PhysicsEngine(arcade.PymunkPhysicsEngine):
             # Go ahead and update velocity
             pymunk.Body.update_velocity(my_body, my_gravity, my_damping, dt)
 
-            # Now see if we are going too fast...
-
-            # Support max velocity
-            if sprite.pymunk.max_velocity:
-                velocity = my_body.velocity.length
-                if velocity > sprite.pymunk.max_velocity:
-                    scale = sprite.pymunk.max_velocity / velocity
-                    my_body.velocity = my_body.velocity * scale
-
-            # Support max horizontal velocity
-            if sprite.pymunk.max_horizontal_velocity:
-                velocity = my_body.velocity.x
-                if abs(velocity) > sprite.pymunk.max_horizontal_velocity:
-                    velocity = sprite.pymunk.max_horizontal_velocity * math.copysign(1, velocity)
-                    my_body.velocity = pymunk.Vec2d(velocity, my_body.velocity.y)
-
-            # Support max vertical velocity
-            if max_vertical_velocity:
-                velocity = my_body.velocity[1]
-                if abs(velocity) > max_vertical_velocity:
-                    velocity = max_horizontal_velocity * math.copysign(1, velocity)
-                    my_body.velocity = pymunk.Vec2d(my_body.velocity.x, velocity)
-
-        # Add callback if we need to do anything custom on this body
-        # if damping or gravity or max_velocity or max_horizontal_velocity or max_vertical_velocity:
+        # Only add the callback if we need to do anything custom on this body, every callback
+        # is a call from Chipmunk into Python for every step. Max. velocities are clamped for all
+        # bodies at once after each step (see VelocityLimits).
         if body_type == self.DYNAMIC:
-            body.velocity_func = velocity_callback
+            if sprite.pymunk.damping is not None or sprite.pymunk.gravity is not None:
+                body.velocity_func = velocity_callback
+            self.velocity_limits.set(body,
+                                     sprite.pymunk.max_velocity,
+                                     sprite.pymunk.max_horizontal_velocity,
+                                     sprite.pymunk.max_vertical_velocity)
 
         # Set the physics shape to the sprite's hitbox
         poly = sprite.get_hit_box()
@@ -177,18 +250,12 @@ class PhysicsEngine(arcade.PymunkPhysicsEngine):
         # Create physics object and add to list
         physics_object = PymunkPhysicsObject(body, shape)
         self.sprites[sprite] = physics_object
+        self.shape_sprites[shape] = sprite
         if body_type != self.STATIC:
             self.non_static_sprite_list.append(sprite)
 
-        # Set collision category
-        old_filter: pymunk.ShapeFilter = physics_object.shape.filter or pymunk.ShapeFilter()
-        physics_object.shape.filter = pymunk.ShapeFilter(old_filter.group,
-                                                         collision_category,
-                                                         old_filter.mask)
-        
-        # Disable given collisions
-        if disable_collisions_for:
-            self.disable_collisions(physics_object, disable_collisions_for)
+        # Set collision category and disable given collisions
+        physics_object.shape.filter = self.collision_filter(collision_type, disable_collisions_for)
 
         # Add body and shape to pymunk engine
         self.space.add(body, shape)
@@ -208,19 +275,342 @@ class PhysicsEngine(arcade.PymunkPhysicsEngine):
                         collision_type: Optional[str] = None,
                         disable_collisions_for: Optional[list[str] | str] = None
                         ):
-        """ Add all sprites in a sprite list to the physics engine. """
+        """ Add all sprites in a sprite list to the physics engine.
+            Collision category and filter are resolved once for the list and all bodies and shapes are added
+            to the space in one call. Sprites that need a velocity callback (custom damping or gravity) are
+            added through add_sprite.
+        """
+        if damping is not None:
+            for sprite in sprite_list:
+                self.add_sprite(sprite=sprite,
+                                mass=mass,
+                                friction=friction,
+                                elasticity=elasticity,
+                                moment_of_inertia=moment_of_intertia,
+                                body_type=body_type,
+                                damping=damping,
+                                collision_type=collision_type,
+                                disable_collisions_for=disable_collisions_for
+                                )
+            return
+
+        collision_category = self.get_collision_category(collision_type)
+        shape_filter = self.collision_filter(collision_type, disable_collisions_for)
 
+        added = []
+        objects = []
+        moments: dict[tuple[float, float], float] = {}
         for sprite in sprite_list:
-            self.add_sprite(sprite=sprite,
-                            mass=mass,
-                            friction=friction,
-                            elasticity=elasticity,
-                            moment_of_inertia=moment_of_intertia,
-                            body_type=body_type,
-                            damping=damping,
-                            collision_type=collision_type,
-                            disable_collisions_for=disable_collisions_for
-                            )
+            if sprite in self.sprites:
+                LOG.warning("Attempt to add a Sprite that has already been added. Ignoring.")
+                continue
+            if sprite.pymunk.damping is not None or sprite.pymunk.gravity is not None:
+                self.add_sprite(sprite=sprite,
+                                mass=mass,
+                                friction=friction,
+                                elasticity=elasticity,
+                                moment_of_inertia=moment_of_intertia,
+                                body_type=body_type,
+                                collision_type=collision_type,
+                                disable_collisions_for=disable_collisions_for
+                                )
+                continue
+
+            moment_of_inertia = moment_of_intertia
+            if moment_of_inertia is None:
+                size = (sprite.width, sprite.height)
+                moment_of_inertia = moments.get(size)
+                if moment_of_inertia is None:
+                    moment_of_inertia = moments[size] = pymunk.moment_for_box(mass, size)
+            body = pymunk.Body(mass, moment_of_inertia, body_type=body_type)
+            body.position = pymunk.Vec2d(sprite.center_x, sprite.center_y)
+            body.angle = math.radians(sprite.angle)
+            if body_type == self.DYNAMIC:
+                self.velocity_limits.set(body,
+                                         sprite.pymunk.max_velocity,
+                                         sprite.pymunk.max_horizontal_velocity,
+                                         sprite.pymunk.max_vertical_velocity)
+
+            scale = sprite.scale
+            shape = pymunk.Poly(body, [(x * scale, y * scale) for x, y in sprite.get_hit_box()])
+            if collision_type:
+                shape.collision_type = collision_category
+            if elasticity is not None:
+                shape.elasticity = elasticity
+            shape.friction = friction
+            shape.filter = shape_filter
+
+            self.sprites[sprite] = PymunkPhysicsObject(body, shape)
+            self.shape_sprites[shape] = sprite
+            if body_type != self.STATIC:
+                self.non_static_sprite_list.append(sprite)
+            objects.append(body)
+            objects.append(shape)
+            added.append(sprite)
+
+        self.space.add(*objects)
+        for sprite in added:
+            sprite.register_physics_engine(self)
+
+
+    def add_static_sprite_list(self,
+                               sprite_list: Iterable[Sprite],
+                               friction: float = 0.2,
+                               elasticity: Optional[float] = None,
+                               collision_type: Optional[str] = "default",
+                               disable_collisions_for: Optional[list[str] | str] = None,
+                               merge_tiles: bool = True):
+        """ Add static sprites (tiles) as shapes of the space's static body.
+            Adjacent square tiles are merged into box shapes (see ggj2024.staticgeometry), all other sprites
+            keep their own hit box shape. Collision handlers and get_sprite_for_shape still resolve the tile.
+
+            :param merge_tiles: Set to False to give every tile its own shape
+        """
+        sprites = []
+        for sprite in sprite_list:
+            if sprite in self.sprites:
+                LOG.warning("Attempt to add a Sprite that has already been added. Ignoring.")
+            else:
+                sprites.append(sprite)
+
+        collision_category = self.get_collision_category(collision_type)
+        settings = {
+            'friction': friction,
+            'filter': self.collision_filter(collision_type, disable_collisions_for),
+        }
+        if collision_type:
+            settings['collision_type'] = collision_category
+        if elasticity is not None:
+            settings['elasticity'] = elasticity
+        self._add_static_tiles(sprites, settings, merge_tiles)
+
+
+    def _add_static_tiles(self, sprites: list[Sprite], settings: dict[str, Any], merge_tiles: bool):
+        if merge_tiles:
+            blocks, single_sprites = merge_box_tiles(sprites)
+        else:
+            blocks, single_sprites = [], sprites
+
+        body = self.space.static_body
+        shapes = []
+        for block in blocks:
+            block.shape = pymunk.Poly(body, block.corners())
+            self.shape_blocks[block.shape] = block
+            physics_object = PymunkPhysicsObject(body, block.shape)
+            for sprite in block.sprites():
+                self.sprites[sprite] = physics_object
+                self.tile_blocks[sprite] = block
+            shapes.append(block.shape)
+
+        for sprite in single_sprites:
+            # The static body sits at the origin, so the hit box is placed in world coordinates
+            angle = math.radians(sprite.angle)
+            poly = [pymunk.Vec2d(x * sprite.scale, y * sprite.scale).rotated(angle) + sprite.position
+                    for x, y in sprite.get_hit_box()]
+            shape = pymunk.Poly(body, poly)
+            self.sprites[sprite] = PymunkPhysicsObject(body, shape)
+            self.shape_sprites[shape] = sprite
+            shapes.append(shape)
+
+        for shape in shapes:
+            for name, value in settings.items():
+                setattr(shape, name, value)
+        for sprite in sprites:
+            sprite.register_physics_engine(self)
+        self.space.add(*shapes)
+
+
+    def remove_sprite(self, sprite: Sprite):
+        physics_object = self.sprites.get(sprite)
+        if physics_object is not None and physics_object.body is self.space.static_body:
+            self._remove_static_tile(sprite, physics_object)
+            return
+        if physics_object is not None:
+            self.shape_sprites.pop(physics_object.shape, None)
+            if physics_object.body is not None:
+                self.velocity_limits.remove(physics_object.body)
+        super().remove_sprite(sprite)
+
+
+    def _remove_static_tile(self, sprite: Sprite, physics_object: PymunkPhysicsObject):
+        shape = physics_object.shape
+        self.space.remove(shape)
+        self.sprites.pop(sprite)
+        block = self.tile_blocks.get(sprite)
+        if block is None:
+            self.shape_sprites.pop(shape, None)
+            return
+        # Split up the block: merge the remaining tiles again, with the same shape settings
+        del self.shape_blocks[shape]
+        remaining = []
+        for tile in block.sprites():
+            del self.tile_blocks[tile]
+            if tile is not sprite:
+                del self.sprites[tile]
+                remaining.append(tile)
+        settings = {
+            'friction': shape.friction,
+            'elasticity': shape.elasticity,
+            'collision_type': shape.collision_type,
+            'filter': shape.filter,
+        }
+        self._add_static_tiles(remaining, settings, merge_tiles=True)
+
+
+    def get_sprite_for_shape(self, shape: Optional[pymunk.Shape], point: Optional[Tuple[float, float]] = None) -> Optional[Sprite]:
+        """ Given a shape, what sprite is associated with it?
+            For merged static tiles this is the tile at (or closest to) `point`.
+        """
+        sprite = self.shape_sprites.get(shape)
+        if sprite is None and shape in self.shape_blocks:
+            block = self.shape_blocks[shape]
+            return block.tile_at(point) if point is not None else block.tiles[0][0]
+        return sprite
+
+
+    def get_sprites_near_shape(self, shape: pymunk.Shape, point: Tuple[float, float], distance: float) -> list[Sprite]:
+        """ All sprites of `shape` that are at most `distance` away from `point` (e.g. for a point query) """
+        block = self.shape_blocks.get(shape)
+        if block is not None:
+            return block.tiles_near(point, distance) or [block.tile_at(point)]
+        sprite = self.shape_sprites.get(shape)
+        return [] if sprite is None else [sprite]
+
+
+    def get_sprites_from_arbiter(self, arbiter: pymunk.Arbiter) -> Tuple[Optional[Sprite], Optional[Sprite]]:
+        """ Given a collision arbiter, return the sprites associated with the collision. """
+        shape1, shape2 = arbiter.shapes
+        sprite1 = self.shape_sprites.get(shape1)
+        sprite2 = self.shape_sprites.get(shape2)
+        if sprite1 is None or sprite2 is None:
+            # Merged static tiles: find the tile at the contact point
+            points = arbiter.contact_point_set.points
+            if sprite1 is None:
+                sprite1 = self.get_sprite_for_shape(shape1, points[0].point_a if points else None)
+            if sprite2 is None:
+                sprite2 = self.get_sprite_for_shape(shape2, points[0].point_b if points else None)
+        return sprite1, sprite2
+
+
+    def update_velocity_limits(self, sprite: Sprite):
+        """Apply changed sprite.pymunk.max_velocity / max_horizontal_velocity / max_vertical_velocity"""
+        physics_object = self.get_physics_object(sprite)
+        if physics_object.body.body_type == self.DYNAMIC:
+            self.velocity_limits.set(physics_object.body,
+                                     sprite.pymunk.max_velocity,
+                                     sprite.pymunk.max_horizontal_velocity,
+                                     sprite.pymunk.max_vertical_velocity)
+
+
+    def save_state(self):
+        """ Remember the current positions of all moving bodies. Call this before the last step of a frame
+            to draw the sprites in between both states with resync_sprites(alpha).
+        """
+        self.previous_state = {sprite: (self.sprites[sprite].body.position, self.sprites[sprite].body.angle)
+                               for sprite in self.non_static_sprite_list}
+
+
+    def resync_sprites(self, alpha: float = 1.0):
+        """ Set visual sprites to the location of their bodies.
+            With alpha < 1 sprites are placed between the state saved with save_state (alpha = 0) and the
+            current state (alpha = 1).
+        """
+        if alpha >= 1.0 or not self.previous_state:
+            super().resync_sprites()
+            return
+
+        # Copy in case a sprite removes itself while iterating
+        for sprite in self.non_static_sprite_list.copy():
+            body = self.sprites[sprite].body
+            if body.is_sleeping:
+                continue
+            position, angle = body.position, body.angle
+            previous = self.previous_state.get(sprite)
+            if previous is not None:
+                previous_position, previous_angle = previous
+                position = previous_position + (position - previous_position) * alpha
+                angle = previous_angle + (angle - previous_angle) * alpha
+            new_angle = math.degrees(angle)
+            dx = position[0] - sprite.center_x
+            dy = position[1] - sprite.center_y
+            d_angle = new_angle - sprite.angle
+            sprite.position = position
+            sprite.angle = new_angle
+            sprite.pymunk_moved(self, dx, dy, d_angle)
+
+
+    def step(self, delta_time: float = 1 / 60.0, resync_sprites: bool = True):
+        """ Advance the simulation by delta_time and clamp velocities afterwards (after the contact solver, see
+            VelocityLimits). """
+        self.space.step(delta_time)
+        self.velocity_limits.apply()
+        if resync_sprites:
+            self.resync_sprites()
+
+
+    def enable_sleeping(self, sleep_time_threshold: float, idle_speed_threshold: float = 0):
+        """ Let bodies that have been idle for `sleep_time_threshold` seconds fall asleep. Sleeping bodies are
+            neither integrated nor collided until something touches them (or they are woken up).
+            With an idle speed threshold of 0 pymunk derives it from the gravity.
+        """
+        self.space.sleep_time_threshold = sleep_time_threshold
+        self.space.idle_speed_threshold = idle_speed_threshold
+
+
+    @property
+    def sleeping_enabled(self) -> bool:
+        return self.space.sleep_time_threshold != float('inf')
+
+
+    def wake_all(self):
+        """ Wake up all sleeping bodies """
+        for body in self.space.bodies:
+            if body.is_sleeping:
+                body.activate()
+
+
+    def wake_bodies_in(self, bb: pymunk.BB):
+        """ Wake up all sleeping bodies touching the given bounding box """
+        for shape in self.space.bb_query(bb, pymunk.ShapeFilter()):
+            if shape.body.is_sleeping:
+                shape.body.activate()
+
+
+    def set_gravity(self, gravity: Union[pymunk.Vec2d, Tuple[float, float]]):
+        """ Change the gravity of the space. Sleeping bodies would not notice, so all of them are woken up. """
+        if tuple(gravity) != tuple(self.space.gravity):
+            self.space.gravity = gravity
+            self.wake_all()
+
+
+    def set_position(self, sprite: Sprite, position: Union[pymunk.Vec2d, Tuple[float, float]]):
+        """ Set the position of a sprite's body.
+            Teleporting a kinematic body (e.g. a platform) does not wake up the bodies resting on it or the ones
+            at its new position, this is done here.
+        """
+        # Teleported, don't interpolate from the old position
+        self.previous_state.pop(sprite, None)
+        physics_object = self.sprites[sprite]
+        body = physics_object.body
+        if body is None or body.body_type != self.KINEMATIC or not self.sleeping_enabled or body.position == position:
+            super().set_position(sprite, position)
+            return
+        old_bb = physics_object.shape.bb
+        super().set_position(sprite, position)
+        new_bb = physics_object.shape.cache_bb()
+        for bb in (old_bb, new_bb):
+            # Grow the box a little, resting bodies only touch it
+            self.wake_bodies_in(pymunk.BB(bb.left - 1, bb.bottom - 1, bb.right + 1, bb.top + 1))
+
+
+    def use_spatial_hash(self, cell_size: float, expected_bodies: int = 0):
+        """ Switch the broadphase from pymunk's bounding box tree to a spatial hash.
+            This works best if most shapes are about `cell_size` large, e.g. uniform tiles. The size of the
+            hash table is derived from the shapes already in the space plus `expected_bodies` added later.
+        """
+        count = self.SPATIAL_HASH_COUNT_PER_SHAPE * (len(self.space.shapes) + expected_bodies)
+        LOG.debug(f"Using spatial hash broadphase (cell size {cell_size}, count {count})")
+        self.space.use_spatial_hash(cell_size, count)
 
 
     def get_collision_category(self, collision_type: str) -> int:
@@ -232,7 +622,40 @@ class PhysicsEngine(arcade.PymunkPhysicsEngine):
                 raise ValueError("Maximum number of collision categories has been reached")
             self.next_collision_category <<= 1
             self.collision_types[collision_type] = category
+            self._mask_cache.clear()
+            self._filter_cache.clear()
         return category
+
+    @staticmethod
+    def _types_key(collision_types: Optional[str | Iterable[str]]) -> Optional[tuple[str, ...]]:
+        if collision_types is None:
+            return None
+        if isinstance(collision_types, str):
+            return (collision_types,)
+        return tuple(collision_types)
+
+    def collision_mask(self, collision_types: str | Iterable[str]) -> int:
+        """Categories of the given collision type(s) or-ed together (memoized)"""
+        key = self._types_key(collision_types)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = 0
+            for collision_type in key:
+                mask |= self.get_collision_category(collision_type)
+            self._mask_cache[key] = mask
+        return mask
+
+    def collision_filter(self, collision_type: Optional[str], disable_collisions_for: Optional[str | Iterable[str]] = None) -> pymunk.ShapeFilter:
+        """Filter for the shape of an object of `collision_type` that collides with everything but `disable_collisions_for` (memoized)"""
+        key = ('object', collision_type, self._types_key(disable_collisions_for))
+        shape_filter = self._filter_cache.get(key)
+        if shape_filter is None:
+            category = self.get_collision_category(collision_type)
+            mask = pymunk.ShapeFilter.ALL_MASKS()
+            if disable_collisions_for:
+                mask &= ~self.collision_mask(disable_collisions_for)
+            shape_filter = self._filter_cache[key] = pymunk.ShapeFilter(categories=category, mask=mask)
+        return shape_filter
     
     
     def get_collision_category_names(self, category: int) -> list[str]:
@@ -243,34 +666,26 @@ class PhysicsEngine(arcade.PymunkPhysicsEngine):
         """Enable or disable collisions for `object` and other objects"""
         if isinstance(object, arcade.Sprite):
             object = self.get_physics_object(object)
-        if isinstance(collision_types, str):
-            collision_types = [collision_types]
-        old_filter = pymunk.ShapeFilter() if object.shape.filter is None else object.shape.filter
-        mask: int = old_filter.mask
-        for collision_type in collision_types:
-            category = self.get_collision_category(collision_type)
-            # category = 1 << category
-            mask |= category
-        object.shape.filter = pymunk.ShapeFilter(old_filter.group,
-                                                 old_filter.categories,
-                                                 mask)
+        object.shape.filter = self._changed_filter(object.shape.filter, collision_types, enable=True)
 
 
     def disable_collisions(self, object: arcade.PymunkPhysicsObject | arcade.Sprite, collision_types: str | Iterable[str]):
         """Disable or disable collisions for `object` and other objects"""
         if isinstance(object, arcade.Sprite):
             object = self.get_physics_object(object)
-        if isinstance(collision_types, str):
-            collision_types = [collision_types]
-        old_filter = pymunk.ShapeFilter() if object.shape.filter is None else object.shape.filter
-        mask: int = old_filter.mask
-        for collision_type in collision_types:
-            category = self.get_collision_category(collision_type)
-            # category = 1 << category
-            mask &= ~category
-        object.shape.filter = pymunk.ShapeFilter(old_filter.group,
-                                                 old_filter.categories,
-                                                 mask)
+        object.shape.filter = self._changed_filter(object.shape.filter, collision_types, enable=False)
+
+    def _changed_filter(self, old_filter: Optional[pymunk.ShapeFilter], collision_types: str | Iterable[str], enable: bool) -> pymunk.ShapeFilter:
+        """`old_filter` with collisions with the given type(s) enabled or disabled (memoized)"""
+        if old_filter is None:
+            old_filter = pymunk.ShapeFilter()
+        key = ('enable' if enable else 'disable', old_filter, self._types_key(collision_types))
+        shape_filter = self._filter_cache.get(key)
+        if shape_filter is None:
+            mask = self.collision_mask(collision_types)
+            mask = old_filter.mask | mask if enable else old_filter.mask & ~mask
+            shape_filter = self._filter_cache[key] = pymunk.ShapeFilter(old_filter.group, old_filter.categories, mask)
+        return shape_filter
     
     def add_collision_handler(self,
                               first_type: str,
@@ -303,13 +718,29 @@ class PhysicsEngine(arcade.PymunkPhysicsEngine):
 
         h = self.space.add_collision_handler(first_type_id, second_type_id)
         if begin_handler:
-            h.begin = _f1
+            h.begin = self._timed_handler(_f1, first_type, second_type, 'begin')
         if post_handler:
-            h.post_solve = _f2
+            h.post_solve = self._timed_handler(_f2, first_type, second_type, 'post_solve')
         if pre_handler:
-            h.pre_solve = _f3
+            h.pre_solve = self._timed_handler(_f3, first_type, second_type, 'pre_solve')
         if separate_handler:
-            h.separate = _f4
+            h.separate = self._timed_handler(_f4, first_type, second_type, 'separate')
+
+    def _timed_handler(self, handler: Callable, first_type: str, second_type: str, kind: str) -> Callable:
+        """Wrap a collision handler so its time is added to self.handler_times (unchanged if it is None)"""
+        times = self.handler_times
+        if times is None:
+            return handler
+        key = f'{first_type}/{second_type}:{kind}'
+        times.setdefault(key, 0.0)
+
+        def _timed(arbiter, space, data):
+            start = time.perf_counter()
+            try:
+                return handler(arbiter, space, data)
+            finally:
+                times[key] += time.perf_counter() - start
+        return _timed
     
     def make_shapefilter(self, collision_types: str | list[str], categories: Optional[list[str]|str] = None, group: int = 0, invert_mask: bool = False, inver_categories: bool = False):
         """Make a shape filter for collisions with the given type(s).
@@ -317,23 +748,24 @@ class PhysicsEngine(arcade.PymunkPhysicsEngine):
         :param categories: collision type(s) this filter should belong to (default: all)
         :param group: collision group (see pymunk's doc on ShapeFilters for details)
         :param invert_mask: invert filter (so that collisions happen with every collision type *excep* the given ones)
+        Filters are memoized, calling this in collision handlers is cheap.
         """
+        key = ('query', self._types_key(collision_types), self._types_key(categories), group, invert_mask, inver_categories)
+        shape_filter = self._filter_cache.get(key)
+        if shape_filter is not None:
+            return shape_filter
+
         if categories is not None:
-            if isinstance(categories, str):
-                categories = self.get_collision_category(categories)
-            else:
-                categories = np.bitwise_or.reduce([self.get_collision_category(c) for c in categories])
+            categories = self.collision_mask(categories)
         else:
             categories = pymunk.ShapeFilter.ALL_CATEGORIES()
-        if isinstance(collision_types, str):
-            mask = self.get_collision_category(collision_types)
-        else:
-            mask = np.bitwise_or.reduce([self.get_collision_category(t) for t in collision_types])
-        
+        mask = self.collision_mask(collision_types)
+
         if inver_categories:
             categories = ~categories
         if invert_mask:
             mask = ~mask
-        
-        return pymunk.ShapeFilter(group, categories, mask)
+
+        shape_filter = self._filter_cache[key] = pymunk.ShapeFilter(group, categories, mask)
+        return shape_filter
         
\ No newline at end of file
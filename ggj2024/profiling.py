@@ -0,0 +1,130 @@
+"""Hierarchical timing of startup phases.
+
+Wrap a phase in `with PROFILER.section('name'):`, nested sections form a tree. The profiler is disabled
+by default, then a section costs a single attribute check. `launch_game --profile-startup` enables it,
+prints the tree once the game is set up and can write a Chrome trace (chrome://tracing, Perfetto).
+"""
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class TimingNode:
+    def __init__(self, name: str):
+        self.name = name
+        self.elapsed = 0.0
+        self.count = 0
+        self.children: dict[str, 'TimingNode'] = {}
+        # Ran in parallel to its parent (other thread), so it is not part of the parent's time
+        self.concurrent = False
+
+    def child(self, name: str) -> 'TimingNode':
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = TimingNode(name)
+        return node
+
+    @property
+    def total(self) -> float:
+        # Grouping nodes (e.g. of worker threads) are never timed themselves
+        if self.count == 0:
+            return sum(c.total for c in self.children.values())
+        return self.elapsed
+
+    @property
+    def self_time(self) -> float:
+        return self.total - sum(c.total for c in self.children.values() if not c.concurrent)
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.root = TimingNode('total')
+        # (name, start, end, thread id, thread name) of every finished section, for the Chrome trace
+        self.events: list[tuple[str, float, float, int, str]] = []
+        self._local = threading.local()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self._start = time.perf_counter()
+
+    def _stack(self) -> list[TimingNode]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            thread = threading.current_thread()
+            if thread is threading.main_thread():
+                root = self.root
+            else:
+                # Sections of worker threads (e.g. level prefetching) get their own subtree
+                with self._lock:
+                    root = self.root.child(f'[thread {thread.name}]')
+                    root.concurrent = True
+            stack = self._local.stack = [root]
+        return stack
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        stack = self._stack()
+        with self._lock:
+            node = stack[-1].child(name)
+        stack.append(node)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            thread = threading.current_thread()
+            with self._lock:
+                node.elapsed += end - start
+                node.count += 1
+                self.events.append((name, start, end, thread.ident, thread.name))
+
+    def finish(self):
+        """Set the total time to the time since the profiler was enabled"""
+        self.root.elapsed = time.perf_counter() - self._start
+        self.root.count = 1
+
+    def report(self) -> str:
+        lines = [f'{"Phase":<56} {"Total [ms]":>11} {"Self [ms]":>11} {"Calls":>6}']
+        lines.append('-' * len(lines[0]))
+
+        def _add(node: TimingNode, depth: int):
+            name = '  ' * depth + node.name
+            lines.append(f'{name:<56} {node.total * 1000:>11.1f} {node.self_time * 1000:>11.1f} {node.count:>6}')
+            for child in sorted(node.children.values(), key=lambda c: c.total, reverse=True):
+                _add(child, depth + 1)
+
+        _add(self.root, 0)
+        return '\n'.join(lines)
+
+    def write_chrome_trace(self, filename: str):
+        """Write all sections in the Chrome trace event format"""
+        trace_events = [{
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self._start) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': 0,
+            'tid': tid,
+        } for name, start, end, tid, _ in self.events]
+        thread_names = {tid: thread_name for _, _, _, tid, thread_name in self.events}
+        trace_events += [{
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': 0,
+            'tid': tid,
+            'args': {'name': thread_name},
+        } for tid, thread_name in thread_names.items()]
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+
+PROFILER = Profiler()
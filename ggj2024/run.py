@@ -1,33 +1,85 @@
-import arcade
 import argparse
 
-from ggj2024.gamewindow import GameWindow
 from ggj2024.config import *
+from ggj2024.profiling import PROFILER
+
+
+def run_headless(seconds: float, debug: bool):
+    """Step the simulation as fast as possible, nothing is drawn and no sound is played"""
+    import time
+    from ggj2024.simulation import Simulation, STEP_DELTA_T
+
+    with PROFILER.section('Simulation.setup'):
+        sim = Simulation(debug=debug)
+        sim.setup(load_themes=False)
+
+    if PROFILER.enabled:
+        PROFILER.finish()
+        print(PROFILER.report())
+
+    steps = round(seconds / STEP_DELTA_T)
+    start = time.perf_counter()
+    sim.run_steps(steps)
+    elapsed = time.perf_counter() - start
+    print(f'Simulated {sim.time:.1f} s in {elapsed:.2f} s ({steps / elapsed:.0f} steps/s, {sim.time / elapsed:.1f}x real time)')
 
 
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--debug', action='store_true')
     parser.add_argument('--no-leapmotion', '-L', action='store_true', help='Do not use leap motion')
+    parser.add_argument('--profile-startup', action='store_true', help='Print a timing report of the startup phases')
+    parser.add_argument('--startup-trace', metavar='FILE', help='Write the startup timings as Chrome trace (implies --profile-startup)')
+    parser.add_argument('--exit-after-startup', action='store_true', help='Quit once the game is set up (for startup measurements)')
+    parser.add_argument('--headless', metavar='SECONDS', type=float, help='Simulate SECONDS of game time without a window and report the throughput')
     args = parser.parse_args()
 
+    if args.profile_startup or args.startup_trace:
+        PROFILER.enable()
+
+    # Imported here so their cost shows up in the startup profile (and --help stays fast)
+    with PROFILER.section('import arcade'):
+        import arcade
+    with PROFILER.section('import pymunk'):
+        import pymunk
+
+    if args.headless is not None:
+        run_headless(args.headless, args.debug)
+        return
+
+    # Not for --headless: the window pulls in sound, input and drawing
+    with PROFILER.section('import ggj2024.gamewindow'):
+        from ggj2024.gamewindow import GameWindow
+
     if args.no_leapmotion:
         leap_motion = False
     else:
         try:
-            import leap
+            with PROFILER.section('import leap'):
+                import leap
             leap_motion = True
         except ImportError:
             print('LeapMotion does not seem to be installed, starting without it')
             leap_motion = False
 
     """ Main function """
-    window = GameWindow(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE, leap_motion=leap_motion, debug=args.debug)
-    window.setup()
-    # HACK: close hands server in better way
-    try:
-        arcade.run()
-    except KeyboardInterrupt:
-        print('KeyboardInterrupt')
+    with PROFILER.section('GameWindow.__init__'):
+        window = GameWindow(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE, leap_motion=leap_motion, debug=args.debug)
+    with PROFILER.section('GameWindow.setup'):
+        window.setup()
+
+    if PROFILER.enabled:
+        PROFILER.finish()
+        print(PROFILER.report())
+        if args.startup_trace:
+            PROFILER.write_chrome_trace(args.startup_trace)
+            print(f'Startup trace written to {args.startup_trace}')
+
+    if not args.exit_after_startup:
+        # HACK: close hands server in better way
+        try:
+            arcade.run()
+        except KeyboardInterrupt:
+            print('KeyboardInterrupt')
     if window.hands:
-        window.hands.stop()
\ No newline at end of file
+        window.hands.stop()
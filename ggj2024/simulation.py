@@ -0,0 +1,794 @@
+"""Game logic without a window.
+
+`Simulation` owns the level, the physics engine, the entities, regions and the input state. It can be
+stepped without a display (benchmarks, soak tests on servers). `GameWindow` feeds it input, draws it and
+turns its events into sound and textures through the `on_*` hooks (hit sounds, blood splatters, deaths,
+level changes). All hooks are optional, without them the simulation just skips these effects.
+"""
+import heapq
+import traceback
+from pathlib import Path
+from typing import Callable, Hashable, Optional
+
+import arcade
+import pymunk
+import numpy as np
+
+from ggj2024.HandReceiver import HandReceiverBase
+
+from ggj2024.config import *
+from ggj2024.utils import *
+from ggj2024.sprites import ParticleSprite, PlayerControlledPlatformSprite, PlayerSprite, SPRITESETS
+from ggj2024.itemspawner import ItemSpawner, Entity
+from ggj2024.region import Region
+from ggj2024.physics_engine import PhysicsEngine
+from ggj2024.particles import BloodParticleSystem, Impact
+from ggj2024.levels import LEVELS, MECHANICS, Level, LevelRegistry
+from ggj2024.assetbank import SpawnableAssetBank
+from ggj2024.profiling import PROFILER
+from ggj2024.timestep import FixedTimestep
+
+
+STEP_DELTA_T = 1/(60*STEPS_PER_FRAME)
+
+
+class InputState:
+    """What the players are currently doing. Written by GameWindow's event handlers (or by a script)."""
+
+    def __init__(self, hands: Optional[HandReceiverBase] = None, controller=None):
+        # Walking
+        self.a_pressed: bool = False
+        self.d_pressed: bool = False
+        self.w_pressed: bool = False
+        self.s_pressed: bool = False
+
+        self.space_pressed: bool = False
+        self.enter_pressed: bool = False
+        self.shift_pressed: bool = False
+
+        # Gravity (debug mode)
+        self.left_pressed: bool = False
+        self.right_pressed: bool = False
+        self.up_pressed: bool = False
+        self.down_pressed: bool = False
+
+        # Screen coordinates of the mouse. Controls the gravity, in debug mode the platforms
+        self.last_mouse_position = 0, 0
+        self.last_mouse_position_left = 0, 0
+        self.last_mouse_position_right = 0, 0
+
+        self.hands = hands or HandReceiverBase()
+        # pyglet.input.Controller, polled for gravity and platforms
+        self.controller = controller
+
+
+class Simulation:
+    """The game world of the current level. Call `update(delta_time)` once per frame."""
+
+    def __init__(self, leap_motion: bool = False, debug: bool = False, input_state: Optional[InputState] = None,
+                 levels: LevelRegistry = LEVELS):
+        self.leap_motion = leap_motion
+        self.debug = debug
+        self.input = input_state or InputState()
+        # The levels that are played (in order)
+        self.levels = levels
+
+        # Physics engine
+        self.physics_engine: Optional[PhysicsEngine] = None
+        # Set to a dict to sum up the time spent in the collision handlers (see PhysicsEngine)
+        self.handler_times: Optional[dict[str, float]] = None
+        # Decides how many fixed physics steps to run per frame
+        self.timestep = FixedTimestep(STEP_DELTA_T, PHYSICS_MAX_STEPS_PER_UPDATE)
+        # Simulated seconds, the clock of spawners and particle lifetimes
+        self.time = 0.0
+
+        # Player sprite
+        self.player_sprite: Optional[PlayerSprite] = None
+
+        # Sprite lists we need
+        self.player_list: Optional[arcade.SpriteList] = None
+        self.wall_list: Optional[arcade.SpriteList] = None
+        self.item_list: Optional[arcade.SpriteList] = None
+        self.controllable_platform_list: Optional[arcade.SpriteList] = None
+        self.particle_list: Optional[arcade.SpriteList] = None
+        # Heap of (killtime, id, particle) of the ParticleSprites, the next one to expire first
+        self.particle_expiry: list[tuple[float, int, ParticleSprite]] = []
+        # Blood particles if BLOOD_PARTICLE_SYSTEM is set (particle_list stays empty then)
+        self.blood: Optional[BloodParticleSystem] = None
+        # Impacts of ParticleSprites, collected by the collision handler and splattered after the step
+        self.particle_impacts: list[Impact] = []
+        self.background_list: Optional[arcade.SpriteList] = None
+        self.soft_list: Optional[arcade.SpriteList] = None
+        self.finish_list: Optional[arcade.SpriteList] = None
+        self.spawned_item_list: Optional[arcade.SpriteList] = None
+
+        self.debug_sprite_list: Optional[arcade.SpriteList] = None
+
+        self.spawnable_assets: Optional[SpawnableAssetBank] = None
+
+        self.regions: list[Region] = []
+        self.entities: list[Entity] = []
+
+        self.current_level = 1
+        self.level_transition = False
+        self.mark_player_dead = None
+
+        self.start_tile: arcade.Sprite = None
+        self.start_center: tuple[int, int] = None
+
+        self.platform_left: PlayerControlledPlatformSprite = None
+        self.platform_right: PlayerControlledPlatformSprite = None
+
+        self.map_bounds_x = 0
+        self.map_bounds_y = 0
+
+        # Part of the world that is shown (bottom left corner and size), platforms are placed relative to it
+        self.view_position = pymunk.Vec2d(0, 0)
+        self.view_size = SCREEN_WIDTH, SCREEN_HEIGHT
+
+        # The default damping for every object controls the percent of velocity
+        # the object will keep each second. A value of 1.0 is no speed loss,
+        # 0.9 is 10% per second, 0.1 is 90% per second.
+        # For top-down games, this is basically the friction for moving objects.
+        # For platformers with gravity, this should probably be set to 1.0.
+        # Default value is 1.0 if not specified.
+        self.damping = DEFAULT_DAMPING
+
+        # Hooks
+        # A collision that should be heard: (volume, key of the colliding pair)
+        self.on_hit: Optional[Callable[[float, Hashable], None]] = None
+        # A blood particle splatters onto a sprite: (sprite, position in the sprite, particle radius, particle color)
+        self.on_splatter: Optional[Callable[[arcade.Sprite, pymunk.Vec2d, float, tuple[int, int, int]], None]] = None
+        # The player died (reason)
+        self.on_player_killed: Optional[Callable[[str], None]] = None
+        # A level was loaded and set up
+        self.on_level_loaded: Optional[Callable[[Level], None]] = None
+
+    def setup(self, load_themes: bool = True):
+        """Create the player and load the current level. Pass load_themes=False if no music is played."""
+        self.load_themes = load_themes
+        self.spawnable_assets = SpawnableAssetBank(sorted(Path('assets/AFOPNGS/').glob('*.png')))
+
+        # Create the sprite lists
+        self.player_list = arcade.SpriteList()
+
+        # Create player sprite. Its hit box is hand-written, so don't compute any for the textures
+        with PROFILER.section('create player sprite'):
+            self.player_sprite = PlayerSprite(hit_box_algorithm="None")
+
+        # Add to player sprite list
+        self.player_list.append(self.player_sprite)
+
+        with PROFILER.section('load_level'):
+            self.load_level(self.current_level)
+
+    def setup_platforms(self):
+        # player-controlled platforms
+
+        self.controllable_platform_list = arcade.SpriteList()
+        tiles = SPRITESETS.GENERAL.get_tiles_by_class('PlayerControlledPlatform')
+        if not tiles:
+            raise RuntimeError('Could not find tile for PlayerControlledPlaform')
+        elif len(tiles) > 1:
+            print('WARNING: More than one PlayerControlledPlatform tile defined')
+        tile = tiles[0]
+        for i in range(2):
+            sprite = SPRITESETS.GENERAL.create_sprite(tile, custom_class=PlayerControlledPlatformSprite)
+            self.controllable_platform_list.append(sprite)
+
+        self.platform_left = self.controllable_platform_list[0]
+        self.platform_right = self.controllable_platform_list[1]
+
+        if self.debug:
+            self.platform_left.active = True
+            self.platform_right.active = True
+
+    def load_level(self, level):
+        self.current_level = level
+
+        self.main_gravity = np.array([0, -GRAVITY], dtype='float')
+
+        # Loads the level if it was not prefetched, unloads old levels and starts prefetching the next one
+        with PROFILER.section('activate level'):
+            level = self.levels.activate(self.current_level, load_theme=self.load_themes)
+
+        tile_map = level.tilemap
+        self.map_bounds_x = tile_map.width * tile_map.tile_width * tile_map.scaling
+        self.map_bounds_y = tile_map.height * tile_map.tile_height * tile_map.scaling
+        self.map_bounds_unscaled = [tile_map.width * tile_map.tile_width, tile_map.height * tile_map.tile_height]
+
+        self.particle_list = arcade.SpriteList()
+        self.particle_expiry = []
+        self.particle_impacts = []
+        self.spawned_item_list = arcade.SpriteList()
+        self.debug_sprite_list = arcade.SpriteList()
+
+        # Decode spawnable items now instead of on their first spawn (no-op after the first level)
+        with PROFILER.section('load spawnable assets'):
+            self.spawnable_assets.load(workers=SPAWNABLE_ASSET_LOADER_THREADS)
+
+        if not BLOOD_PARTICLE_SYSTEM:
+            # Render all particle textures now instead of on the first deaths (no-op after the first level)
+            with PROFILER.section('warm particle textures'):
+                ParticleSprite.warm_textures()
+
+        # Pull the sprite layers out of the tile map
+        self.wall_list = tile_map.sprite_lists["Platforms"]
+        self.item_list = tile_map.sprite_lists["Dynamic Items"]
+        self.background_list = tile_map.sprite_lists["Background"]
+        self.soft_list = tile_map.sprite_lists.get('Soft') or arcade.SpriteList()
+        self.finish_list = tile_map.sprite_lists.get('Finish') or arcade.SpriteList()
+
+        map_entities = tile_map.sprite_lists.get('Entities') or []
+        map_objects = tile_map.object_lists.get('Regions') or []
+
+        # Get player start from level
+        start_sprite_list = tile_map.sprite_lists.get('Start')
+        if start_sprite_list:
+            start_sprite: arcade.Sprite = start_sprite_list[0]
+            self.player_sprite.center_x = start_sprite.center_x
+            self.player_sprite.center_y = start_sprite.center_y
+            self.start_tile = start_sprite
+            self.start_center = self.start_tile.center_x, self.start_tile.center_y
+        else:
+            print("WARNING: No start was defined, player will spawn in the center of the level")
+            self.start_tile = None
+            self.start_center = ((tile_map.width * SPRITE_SIZE) / 2, (tile_map.height * SPRITE_SIZE) / 2)
+            self.player_sprite.center_x, self.player_sprite.center_y = self.start_center
+
+        # Load objectes and entities
+        regions = dict[int, Region]()
+        for obj in (map_objects):
+            print(f'Loading object (type={obj.type})')
+            match obj.type:
+                case 'region':
+                    shape = [(x*tile_map.scaling, self.map_bounds_y + y*tile_map.scaling) for x, y in obj.shape]
+                    region = Region(shape, self.player_sprite)
+                    regions[obj.properties['id']] = region
+                    self.regions.append(region)
+                case _:
+                    print(f"ERROR: unknown object type (=Class): {obj.type}")
+                    continue
+
+        try:
+            for e in self.entities:
+                self.physics_engine.remove_sprite(e.sprite)
+        except: pass
+        self.entities = []
+        for sprite in map_entities:
+            t = sprite.properties.get('type')
+            print(f'Loading entity (type={t})')
+            match t:
+                case 'object_spawner':
+                    region_id = sprite.properties.get('active_region')
+                    if region_id is None:
+                        region = None
+                    else:
+                        region = regions.get(region_id)
+                        if region is None:
+                            print(f'WARNING: ObjectSpawner had an active region defined (id={region_id}) but it was not found')
+                    interval = sprite.properties.get('interval') or 1.0
+                    entity = ItemSpawner(sprite, self.item_spawned, self.spawnable_assets, max_scale=2, active_region=region, spawn_interval=interval,
+                                         clock=lambda: self.time)
+                case _:
+                    print(f"ERROR: unknown entity type (=Class): {sprite.properties.get('type')}")
+                    continue
+            self.entities.append(entity)
+        # Get finish
+        if not self.finish_list:
+            print('WARNING: No finish was defined, this level is unbeatable!')
+
+        # Loading took a while, don't try to catch up with it
+        self.timestep.reset()
+
+        with PROFILER.section('populate physics engine'):
+            # Create the physics engine
+            self.physics_engine = PhysicsEngine(damping=self.damping,
+                                                gravity=tuple(self.main_gravity),
+                                                handler_times=self.handler_times)
+            if PHYSICS_SLEEP_TIME:
+                # Resting items fall asleep, changing the gravity or moving a platform wakes them up again
+                self.physics_engine.enable_sleeping(PHYSICS_SLEEP_TIME)
+
+            # Add the player.
+            # For the player, we set the damping to a lower value, which increases
+            # the damping rate. This prevents the character from traveling too far
+            # after the player lets off the movement keys.
+            # Setting the moment to PymunkPhysicsEngine.MOMENT_INF prevents it from
+            # rotating.
+            # Friction normally goes between 0 (no friction) and 1.0 (high friction)
+            # Friction is between two objects in contact. It is important to remember
+            # in top-down games that friction moving along the 'floor' is controlled
+            # by damping.
+            self.physics_engine.add_sprite(self.player_sprite,
+                                           friction=PLAYER_FRICTION,
+                                           mass=PLAYER_MASS,
+                                           moment=arcade.PymunkPhysicsEngine.MOMENT_INF,
+                                           collision_type="player",
+                                           max_horizontal_velocity=PLAYER_MAX_HORIZONTAL_SPEED,
+                                           max_vertical_velocity=PLAYER_MAX_VERTICAL_SPEED,
+                                           disable_collisions_for=['particle', 'background'])
+
+            # By setting the body type to PymunkPhysicsEngine.STATIC the walls can't
+            # move.
+            # Movable objects that respond to forces are PymunkPhysicsEngine.DYNAMIC
+            # PymunkPhysicsEngine.KINEMATIC objects will move, but are assumed to be
+            # repositioned by code and don't respond to physics forces.
+            # Dynamic is default.
+            self.physics_engine.add_static_sprite_list(self.wall_list,
+                                                       friction=WALL_FRICTION,
+                                                       collision_type="wall",
+                                                       merge_tiles=MERGE_STATIC_TILES)
+            # Create backgrounds
+            self.physics_engine.add_static_sprite_list(self.background_list,
+                                                       collision_type="background",
+                                                       disable_collisions_for=['player', 'item', 'wall', 'soft', 'finish'],
+                                                       merge_tiles=MERGE_STATIC_TILES)
+            # Create soft static objects
+            self.physics_engine.add_static_sprite_list(self.soft_list,
+                                                       collision_type='soft',
+                                                       elasticity=1.0,
+                                                       merge_tiles=MERGE_STATIC_TILES)
+            # Create the items
+            self.physics_engine.add_sprite_list(self.item_list,
+                                                friction=DYNAMIC_ITEM_FRICTION,
+                                                collision_type="item",
+                                                disable_collisions_for=['background', 'finish'])
+            # Create finish object
+            self.physics_engine.add_static_sprite_list(self.finish_list,
+                                                       collision_type='finish',
+                                                       disable_collisions_for=['item', 'wall', 'soft', 'finish'],
+                                                       merge_tiles=MERGE_STATIC_TILES)
+
+            # add platforms moved by second player
+            self.setup_platforms()
+            self.physics_engine.add_sprite_list(self.controllable_platform_list,
+                                                friction=DYNAMIC_ITEM_FRICTION,
+                                                collision_type="platform",
+                                                body_type=arcade.PymunkPhysicsEngine.KINEMATIC,
+                                                disable_collisions_for=['background', 'particle'])
+
+            if PHYSICS_SPATIAL_HASH:
+                # Tiles, items and particles are all about one tile large or smaller
+                self.physics_engine.use_spatial_hash(tile_map.tile_width * tile_map.scaling,
+                                                     expected_bodies=MAX_SPAWNED_ITEMS + BLOOD_PARTICLES_PER_SPLATTER)
+
+            if BLOOD_PARTICLE_SYSTEM:
+                self.blood = BloodParticleSystem(self.physics_engine, tile_map.tile_width * tile_map.scaling)
+            else:
+                self.blood = None
+
+        # Collisions
+        def handle_player_wall_collision(player_sprite: PlayerSprite, wall_sprite: arcade.sprite, arbiter: pymunk.Arbiter, space, data):
+            if self.mark_player_dead:
+                return False
+            self.report_collision_hit(arbiter)
+            impulse: pymunk.Vec2d = arbiter.total_impulse
+            if impulse.length > PLAYER_DEATH_IMPULSE:
+                print(f'died from wall (impulse={impulse.length})')
+                self.mark_player_dead = 'Wall'
+            return True
+
+        def handle_player_item_collision(player_sprite: PlayerSprite, item_sprite: arcade.Sprite, arbiter: pymunk.Arbiter, space, data):
+            if self.mark_player_dead:
+                return False
+            self.report_collision_hit(arbiter)
+            impulse: pymunk.Vec2d = arbiter.total_impulse
+            if impulse.length > PLAYER_DEATH_IMPULSE:
+                print(f'died from item (impulse={impulse.length})')
+                self.mark_player_dead = 'Item'
+            return True
+
+        def handle_player_finish_collision(player: PlayerSprite, finish: arcade.Sprite, arbiter: pymunk.Arbiter, space, data):
+            print('Congratulations, you reached the goal!')
+            self.level_transition = True
+            return False
+
+        def handle_platform_collision(player: PlayerSprite, platform: PlayerControlledPlatformSprite, arbiter: pymunk.Arbiter, space, data):
+            # If platform is active: return True => continue with collision
+            # Else: return False to ignore collision
+            return platform.active
+
+        self.physics_engine.add_collision_handler('player', 'wall', post_handler=handle_player_wall_collision)
+        self.physics_engine.add_collision_handler('player', 'item', post_handler=handle_player_item_collision)
+        self.physics_engine.add_collision_handler('player', 'finish', begin_handler=handle_player_finish_collision)
+
+        self.physics_engine.add_collision_handler('player', 'platform', begin_handler=handle_platform_collision)
+        self.physics_engine.add_collision_handler('item', 'platform', begin_handler=handle_platform_collision)
+
+        def handle_item_wall_collision(item: arcade.Sprite, wall: arcade.Sprite, arbiter: pymunk.Arbiter, space, data):
+            self.report_collision_hit(arbiter)
+
+        self.physics_engine.add_collision_handler('item', 'wall', post_handler=handle_item_wall_collision)
+        self.physics_engine.add_collision_handler('item', 'item', post_handler=handle_item_wall_collision)
+
+        # Finds where the blood splatters onto the walls and items, drawing it is up to on_splatter
+        def handle_particle_collision(particle: ParticleSprite, other: arcade.Sprite, arbiter: pymunk.Arbiter, space: pymunk.Space, data):
+            """Handle a collision between a blood particle and a static object (walls, backgrounds)"""
+            try:
+                if particle not in self.physics_engine.sprites:
+                    # Was already removed by other collision...? Happens quite often
+                    # TODO: investigate this. Is this a bug and can this be avoided? (performance)
+                    return False
+
+                particle_obj: arcade.PymunkPhysicsObject = self.physics_engine.get_physics_object(particle)
+                impact_v = particle_obj.body.velocity
+                impact_pos: pymunk.Vec2d = arbiter.contact_point_set.points[0].point_b
+                # Only remember the impact, splattering is done after the step
+                self.particle_impacts.append(Impact(impact_pos, impact_v, particle.radius, particle.color))
+
+                # Collision handled, remove particle (O(N) in arcade, see expire_particles)
+                self.physics_engine.remove_sprite(particle)
+                self.particle_list.remove(particle)
+            except Exception as err:
+                traceback.print_exception(err)
+            # Sprite is removed, don't continue collision
+            return False
+
+        self.physics_engine.add_collision_handler('particle', 'wall', begin_handler=handle_particle_collision)
+        self.physics_engine.add_collision_handler('particle', 'soft', begin_handler=handle_particle_collision)
+        self.physics_engine.add_collision_handler('particle', 'item', begin_handler=handle_particle_collision)
+        self.physics_engine.add_collision_handler('particle', 'background', begin_handler=handle_particle_collision)
+
+        if self.on_level_loaded:
+            self.on_level_loaded(level)
+
+    @property
+    def main_gravity(self):
+        return self._main_gravity
+
+    @main_gravity.setter
+    def main_gravity(self, grav):
+        if isinstance(grav, np.ndarray):
+            self._main_gravity = grav
+        else:
+            self._main_gravity = np.array(grav, dtype='float')
+        # Don't try to get the length of a zero vector
+        if np.any(self._main_gravity):
+            self._main_gravity_direction = normalize_vector(self._main_gravity)
+        else:
+            # Don't allow zero gravity. Set it to what it was before instead, just very small
+            print('WARNING: It was attempted to set gravity to 0, setting it to a very low value instead')
+            self._main_gravity = self._main_gravity_direction * 1e-9
+            # No need to set direction vector as it didn't change
+        if self.physics_engine:
+            self.physics_engine.set_gravity(tuple(self._main_gravity))
+
+    @property
+    def main_gravity_dir(self):
+        """The direction (= normalized vector) of the main gravity"""
+        return self._main_gravity_direction
+
+    def point_to_sprite(self, sprite: arcade.Sprite, point: pymunk.Vec2d | tuple):
+        """Convert a point from world space to sprite space (0, 0 is the bottom left corner of the sprite)"""
+        if not isinstance(point, pymunk.Vec2d):
+            point = pymunk.Vec2d(*point)
+        # Sprite's position is unreliable, use physics object
+        body = self.physics_engine.get_physics_object(sprite).body
+        if body is self.physics_engine.space.static_body:
+            # Static tiles share one body at the origin, they never move
+            return point - sprite.position + pymunk.Vec2d(sprite.width/2, sprite.height/2)
+        # Get position on the top left (default is center)
+        s_rot = body.angle
+        if s_rot == 0.0:
+            # No rotation, simple case
+            return point - body.position + pymunk.Vec2d(sprite.width/2, sprite.height/2)
+        # Handle rotation
+        s_pos: pymunk.Vec2d = point - body.position
+        s_pos = s_pos.rotated(-s_rot)
+        return s_pos + pymunk.Vec2d(sprite.width/2, sprite.height/2)
+
+    def splatter(self, impact_pos: pymunk.Vec2d, impact_v: pymunk.Vec2d, radius: float, color: tuple[int, int, int]):
+        """Find the sprites a blood particle that hit something at `impact_pos` splatters onto, drawing it is up to on_splatter"""
+        # TODO: normal or uniform distribution?
+        additional_movement = abs(np.random.normal() * BLOOD_SPLATTER_IMPACT_RANGE) * impact_v
+        splatter_pos = impact_pos + additional_movement
+
+        if DEBUG_BLOOD_SPLATTER:
+            # Draw a small dot at final splatter position
+            dbg_sprite_final = arcade.SpriteCircle(1, (0, 0, 255))
+            dbg_sprite_final.position = splatter_pos
+            self.debug_sprite_list.append(dbg_sprite_final)
+
+        if self.on_splatter:
+            collision_filter = self.physics_engine.make_shapefilter(['wall', 'background', 'soft', 'item'], categories='particle')
+            collisions = self.physics_engine.space.point_query(splatter_pos, max_distance=int(radius), shape_filter=collision_filter)
+            if DEBUG_BLOOD_SPLATTER:
+                print('Collision with', len(collisions), 'shapes')
+
+            # Merged static tiles are a single shape, splatter every tile within reach
+            for collision_info in collisions:
+                for sprite in self.physics_engine.get_sprites_near_shape(collision_info.shape, splatter_pos, int(radius)):
+                    self.on_splatter(sprite, self.point_to_sprite(sprite, splatter_pos), radius, color)
+
+    def update_blood(self, delta_time):
+        """Move the blood particles and splatter the ones that hit something"""
+        if not self.blood.count:
+            return
+        items = [self.physics_engine.sprites[sprite].shape for sprite_list in (self.item_list, self.spawned_item_list)
+                 for sprite in sprite_list if sprite in self.physics_engine.sprites]
+        for impact in self.blood.step(delta_time, tuple(self.main_gravity), items):
+            self.splatter(impact.point, impact.velocity, impact.radius, impact.color)
+
+    def kill_player(self, reason):
+        print('Player died:', reason)
+        if self.on_player_killed:
+            self.on_player_killed(reason)
+        self.spawn_blood_particles(self.player_sprite.position, BLOOD_PARTICLES_PER_SPLATTER)
+        self.physics_engine.set_position(self.player_sprite,
+                                             self.start_center)
+        self.mark_player_dead = None
+
+    def spawn_blood_particles(self, position, count):
+        if self.blood is not None:
+            self.blood.spawn(position, count, self.time)
+            return
+        x, y = position
+        particle_mass = 0.5
+        for i in range(count):
+            particle_size = np.random.rand()*BLOOD_PARTICLE_SIZE_RANGE + BLOOD_PARTICLE_SIZE_MIN
+            particle = ParticleSprite(x, y, particle_size, particle_mass, spawn_time=self.time)
+            self.particle_list.append(particle)
+            heapq.heappush(self.particle_expiry, (particle.killtime, id(particle), particle))
+            self.physics_engine.add_sprite(particle, particle_mass, radius=particle_size, collision_type='particle')
+            self.physics_engine.apply_impulse(particle, tuple((np.random.rand(2)-.5)*BLOOD_IMPULSE))
+
+    def report_collision_hit(self, arbiter: pymunk.Arbiter):
+        """Pass a collision that is hard enough to be heard on to on_hit"""
+        p = arbiter.total_impulse.length
+        if p > HITSOUND_MIN_IMPULSE and self.on_hit:
+            vol = (p - HITSOUND_MIN_IMPULSE) / HITSOUND_RANGE
+            # Contacts of the same pair of shapes on several substeps are merged into one hit
+            self.on_hit(min(1.0, vol), frozenset(arbiter.shapes))
+
+    def spawn_item(self, filename, center_x, center_y, width, height, mass=5.0, friction=0.2, elasticity=None):
+        """Spawn one of the diversifier items into the scene"""
+        texture = self.spawnable_assets.get_texture(filename)
+        sprite = arcade.Sprite(texture=texture, center_x=center_x, center_y=center_y)
+        sprite.width = width
+        sprite.height = height
+        self.item_spawned(sprite, mass, friction, elasticity)
+        return sprite
+
+    def spawn_random_item(self, center_x, center_y, width=64, height=64, mass=5.0, friction=0.2, elasticity=None):
+        variant = self.spawnable_assets.random_variant((width, height))
+        sprite = self.spawnable_assets.create_sprite(variant, center_x, center_y)
+        self.item_spawned(sprite, mass, friction, elasticity)
+        return sprite
+
+    def item_spawned(self, sprite, mass=5.0, friction=0.2, elasticity=None):
+        while len(self.spawned_item_list) >= MAX_SPAWNED_ITEMS:
+            removed = self.spawned_item_list.pop(0)
+            self.physics_engine.remove_sprite(removed)
+        self.spawned_item_list.append(sprite)
+        self.physics_engine.add_sprite(sprite,
+                                       mass,
+                                       friction,
+                                       elasticity,
+                                       max_velocity=ITEM_MAX_VELOCITY,
+                                       collision_type='item',
+                                       disable_collisions_for=['backround', 'finish']
+                                       )
+
+    @property
+    def current_mechanics(self):
+        return self.levels[self.current_level].mechanics
+
+    def update_gravity(self):
+        if not self.current_mechanics == MECHANICS.GRAVITY:
+            return
+        new_grav = None
+        hands = self.input.hands
+        controller = self.input.controller
+
+        if self.debug:
+            # This one will set gravity to 0 if two opposite keys are pressed, is this good...?
+            # TODO: maybe also make mouse controlled gravity an optional feature and include this one again?
+            x = 0
+            y = 0
+            if self.input.left_pressed and not self.input.right_pressed:
+                x = -GRAVITY
+            elif self.input.right_pressed and not self.input.left_pressed:
+                x = GRAVITY
+            if self.input.up_pressed and not self.input.down_pressed:
+                y = GRAVITY
+            elif self.input.down_pressed and not self.input.up_pressed:
+                y = -GRAVITY
+            if x or y:
+                new_grav = np.array([x, y], dtype='float')
+
+        else:
+            if self.leap_motion:
+                left_hand = (hands.left_hand.x, hands.left_hand.y)
+                right_hand = (hands.right_hand.x, hands.right_hand.y)
+
+                # update gravity based on hand positions of second player
+                v = np.array(right_hand) - np.array(left_hand)
+
+                if np.linalg.norm(v) < 1e-6:
+                    return
+
+                new_grav = (v[1], -v[0])
+                new_grav = normalize_vector(new_grav) * GRAVITY
+
+                fists_shown = hands.left_hand.grab_angle > FIST_THRESHOLD and hands.right_hand.grab_angle > FIST_THRESHOLD
+                if fists_shown:
+                    new_grav = -new_grav
+            elif controller:
+                stick_dir = pymunk.Vec2d(controller.rightx, controller.righty)
+                if stick_dir.length > CONTROLLER_STICK_GRAVITY_DEADZONE:
+                    new_grav = stick_dir.normalized() * 2000
+            else:
+                new_grav = np.array([SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2]) - np.array(self.input.last_mouse_position)
+                new_grav = normalize_vector(new_grav) * GRAVITY
+
+        if new_grav is not None:
+            self.main_gravity = new_grav
+
+    def update_platforms(self):
+        if not self.current_mechanics == MECHANICS.PLATFORMS:
+            return
+        view_x, view_y = self.view_position
+        view_width, view_height = self.view_size
+
+        if self.debug:
+            # update platform position based on mouse input
+            if not self.platform_left.active:
+                pos = tuple(self.view_position + pymunk.Vec2d(*self.input.last_mouse_position_left))
+                self.physics_engine.set_position(self.platform_left, pos)
+            if not self.platform_right.active:
+                pos = tuple(self.view_position + pymunk.Vec2d(*self.input.last_mouse_position_right))
+                self.physics_engine.set_position(self.platform_right, pos)
+
+        elif self.leap_motion:
+            # update platform positions based on second player input
+            for platform, hand in [(self.platform_left, self.input.hands.left_hand), (self.platform_right, self.input.hands.right_hand)]:
+                if not platform or not hand:
+                    continue
+                if platform.active and hand.grab_angle > FIST_THRESHOLD:
+                    platform.active = True
+                elif not platform.active and hand.grab_angle < FIST_THRESHOLD:
+                    platform.active = False
+                if not platform.active:
+                    pos = (view_x + view_width/2 + hand.x,
+                           view_y + view_height/2 + hand.y)
+                    self.physics_engine.set_position(platform, pos)
+
+        elif self.input.controller:
+            controller = self.input.controller
+            lt = controller.lefttrigger < CONTROLLER_TRIGGER_PLATFORM_THRESHOLD
+            rt = controller.righttrigger < CONTROLLER_TRIGGER_PLATFORM_THRESHOLD
+            cx = controller.rightx * CONTROLLER_PLATFORM_MULTIPLIER
+            cy = controller.righty * CONTROLLER_PLATFORM_MULTIPLIER
+            for platform, trigger in [(self.platform_left, lt), (self.platform_right, rt)]:
+                if not platform:
+                    continue
+                if not platform.active and trigger:
+                    platform.active = True
+                elif platform.active and not trigger:
+                    platform.active = False
+                if not platform.active:
+                    pos = (view_x + view_width/2 + cx, view_y + view_height/2 + cy)
+                    self.physics_engine.set_position(platform, pos)
+
+    def next_level(self):
+        self.load_level(self.levels.next_level(self.current_level))
+
+    def is_player_sprinting(self):
+        controller = self.input.controller
+        if controller:
+            if controller.x or controller.y:
+                return True
+        if self.input.shift_pressed:
+            return True
+        return False
+
+    def do_physics_step(self, delta_time, resync_sprites: bool):
+        """ Movement and game logic """
+        player_object = self.physics_engine.get_physics_object(self.player_sprite)
+
+        x_inbounds = (0 <= player_object.body.position.x <= self.map_bounds_x)
+        y_inbounds = (0 <= player_object.body.position.y <= self.map_bounds_y)
+        if not (x_inbounds and y_inbounds):
+            self.mark_player_dead = 'out_of_bounds'
+
+        if self.mark_player_dead:
+            self.kill_player(self.mark_player_dead)
+
+        # Rotate player to gravity
+        gravity_angle = np.arctan2(*self.main_gravity_dir)
+        player_object.shape.body.angle = np.pi - gravity_angle
+        player_velocity: pymunk.Vec2d = player_object.body.velocity.rotated(gravity_angle)
+        speed = -player_velocity.x
+
+        # Update player based on key press
+        is_on_ground = self.physics_engine.is_on_ground(self.player_sprite)
+        is_sprinting = self.is_player_sprinting()
+        if is_on_ground:
+            movement_force = PLAYER_SPRINT_FORCE_ON_GROUND if is_sprinting else PLAYER_MOVE_FORCE_ON_GROUND
+        else:
+            movement_force = PLAYER_SPRINT_FORCE_IN_AIR if is_sprinting else PLAYER_MOVE_FORCE_IN_AIR
+        # movement_force = PLAYER_MOVE_FORCE_ON_GROUND if is_on_ground else PLAYER_MOVE_FORCE_IN_AIR
+        speed_limit = (PLAYER_MAX_SPRINTING_SPEED if is_sprinting else PLAYER_MAX_WALKING_SPEED) if is_on_ground else PLAYER_MAX_AIRCONTROL_SPEED
+        if self.input.a_pressed and not self.input.d_pressed:
+            # Create a force to the left, perpendicular to the gravity.
+            # Gravity pulls down so this actually needs to be the gravity rotated *clockwise*
+            if FORCES_RELATIVE_TO_PLAYER:
+                if not(speed <= -speed_limit):
+                    self.physics_engine.apply_force(self.player_sprite, (-movement_force, 0))
+            else:
+                force_dir = rotate90_cw(self.main_gravity_dir)
+                self.apply_force_to_player(force_dir, PLAYER_MOVE_FORCE_ON_GROUND if is_on_ground else PLAYER_MOVE_FORCE_IN_AIR)
+            # Set friction to zero for the player while moving
+            self.physics_engine.set_friction(self.player_sprite, 0)
+        elif self.input.d_pressed and not self.input.a_pressed:
+            # Create a force to the right, perpendicular to the gravity.
+            # Gravity pulls down so this actually needs to be the gravity rotated *counterclockwise*
+            if FORCES_RELATIVE_TO_PLAYER:
+                if not(speed >= speed_limit):
+                    self.physics_engine.apply_force(self.player_sprite, (movement_force, 0))
+            else:
+                force_dir = rotate90_ccw(self.main_gravity_dir)
+                self.apply_force_to_player(force_dir, PLAYER_MOVE_FORCE_ON_GROUND if is_on_ground else PLAYER_MOVE_FORCE_IN_AIR)
+            # Set friction to zero for the player while moving
+            self.physics_engine.set_friction(self.player_sprite, 0)
+        elif self.input.w_pressed and not self.input.s_pressed:
+            pass
+        elif self.input.s_pressed and not self.input.w_pressed:
+            pass
+        else:
+            # Player's feet are not moving. Therefore up the friction so we stop.
+            self.physics_engine.set_friction(self.player_sprite, 1.0)
+
+        self.update_gravity()
+        self.update_platforms()
+        for entity in self.entities:
+            entity.update()
+
+        self.physics_engine.step(delta_time, resync_sprites)
+        if self.particle_impacts:
+            impacts, self.particle_impacts = self.particle_impacts, []
+            for impact in impacts:
+                self.splatter(*impact)
+        if self.blood is not None:
+            self.update_blood(delta_time)
+        self.time += delta_time
+
+    def update(self, delta_time: float) -> int:
+        """Advance the simulation by the elapsed (real) time. Returns the number of physics steps run."""
+        # Advance the simulation by as many fixed steps as fit into the elapsed time, then resync the sprites
+        steps = self.timestep.advance(delta_time)
+        for i in range(steps):
+            if PHYSICS_INTERPOLATION and i == steps - 1:
+                self.physics_engine.save_state()
+            self.do_physics_step(STEP_DELTA_T, resync_sprites=False)
+        # Time that is not simulated yet is carried over, draw the sprites that far between the last two steps
+        self.physics_engine.resync_sprites(self.timestep.alpha if PHYSICS_INTERPOLATION else 1.0)
+
+        # Delete old blood
+        if self.blood is not None:
+            self.blood.expire(self.time)
+        self.expire_particles()
+
+        if self.level_transition:
+            self.next_level()
+            self.level_transition = False
+        return steps
+
+    def expire_particles(self):
+        """Remove the ParticleSprites whose lifetime is over. The heap finds them without looking at the other
+        particles, but arcade's SpriteList.remove is O(N) per sprite (it searches the list and the index buffer),
+        so expiring k particles still costs O(k * N). Rebuilding the list once per frame (clear and extend) would
+        be O(N), but it re-creates the GPU buffers and is slower for the particle counts of the game."""
+        expiry = self.particle_expiry
+        while expiry and expiry[0][0] <= self.time:
+            _, _, particle = heapq.heappop(expiry)
+            # Particles that hit a wall are already gone
+            if particle.sprite_lists:
+                self.physics_engine.remove_sprite(particle)
+                self.particle_list.remove(particle)
+
+    def run_steps(self, steps: int):
+        """Run `steps` physics steps as fast as possible (headless runs), every step is a frame of its own"""
+        for _ in range(steps):
+            self.update(STEP_DELTA_T)
@@ -0,0 +1,96 @@
+import random
+from typing import Hashable, Optional
+
+import arcade
+import pyglet.media
+
+from ggj2024.config import *
+
+
+class CollisionSoundPool:
+    """Plays collision hit sounds on a fixed set of reusable players.
+
+    Hits are only collected during a frame (`hit()`), hits with the same key (e.g. the same pair of shapes
+    hitting each other on several substeps) are merged. `flush()` then plays the loudest `max_per_frame`
+    hits of the frame, stealing the oldest voice if all of them are busy.
+    """
+
+    def __init__(self, sounds: list[arcade.Sound], max_voices: int = HITSOUND_MAX_VOICES, max_per_frame: int = HITSOUND_MAX_PER_FRAME):
+        self.sounds = sounds
+        self.max_per_frame = max_per_frame
+        self.voices: list[pyglet.media.Player] = [pyglet.media.Player() for _ in range(max_voices)]
+        # Index of the voice that will be stolen next if no voice is free
+        self._next_voice = 0
+        self._pending: dict[Hashable, float] = {}
+
+        # Counters
+        self.hits = 0
+        self.played = 0
+        self.merged = 0
+        self.dropped = 0
+
+    def hit(self, volume: float, key: Optional[Hashable] = None):
+        """Register a hit with the given volume for this frame"""
+        self.hits += 1
+        if key is None:
+            key = (None, self.hits)
+        old_volume = self._pending.get(key)
+        if old_volume is not None:
+            self.merged += 1
+            if old_volume >= volume:
+                return
+        self._pending[key] = volume
+
+    def flush(self):
+        """Play the loudest hits of this frame. Call this once per frame."""
+        if not self._pending:
+            return
+        volumes = sorted(self._pending.values(), reverse=True)
+        self._pending.clear()
+        self.dropped += max(0, len(volumes) - self.max_per_frame)
+        for volume in volumes[:self.max_per_frame]:
+            self._play(random.choice(self.sounds), volume)
+
+    def _get_voice(self) -> pyglet.media.Player:
+        for voice in self.voices:
+            if voice.source is None:
+                return voice
+        voice = self.voices[self._next_voice]
+        self._next_voice = (self._next_voice + 1) % len(self.voices)
+        self._silence(voice)
+        return voice
+
+    @staticmethod
+    def _silence(voice: pyglet.media.Player):
+        # Discard whatever the voice is currently playing
+        while voice.source is not None:
+            voice.next_source()
+
+    def _play(self, sound: arcade.Sound, volume: float):
+        voice = self._get_voice()
+        voice.volume = volume
+        voice.queue(sound.source)
+        voice.play()
+        self.played += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'played': self.played,
+            'merged': self.merged,
+            'dropped': self.dropped,
+        }
+
+    def stop(self):
+        """Silence all voices and drop the hits of this frame (e.g. on level change). The pool stays usable."""
+        self._pending.clear()
+        for voice in self.voices:
+            voice.pause()
+            self._silence(voice)
+
+    def close(self):
+        """Stop and delete the players, the pool can not be used afterwards"""
+        self.stop()
+        for voice in self.voices:
+            voice.delete()
+        self.voices = []
@@ -0,0 +1,308 @@
+"""Blood splatters painted onto the textures of walls and items.
+
+The simulation only reports where blood hits a sprite (`SplatterStore.enqueue`), painting happens once per
+frame in `SplatterStore.paint`, within a time budget (the rest is painted in the next frames). Every
+splattered sprite gets a texture of its own, backed by a premultiplied uint8 pixel buffer that stays in memory
+(see ggj2024.compositing). Stamps come pre-rendered from a `StampBank`, a stamp composites only the rectangle
+it covers and marks it dirty, `SplatterStore.upload` then writes just the dirty
+rectangles to the texture atlas (once per frame, no matter how many stamps hit a sprite).
+"""
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+import arcade
+import numpy as np
+from PIL import Image, ImageDraw
+
+from ggj2024.config import *
+from ggj2024.utils import create_circle_image
+from ggj2024.compositing import Compositor, div255, premultiply, unpremultiply
+from ggj2024.sprites import ParticleSprite
+
+
+def splatter_mask(diameter: int, shape: int) -> np.ndarray:
+    """Coverage (uint8) of a splatter. Shape 0 is a circle, the others are a smaller blob with a few droplets
+    around it (the same for every call)."""
+    if shape == 0:
+        return np.asarray(create_circle_image(diameter, (255, 255, 255), BLOOD_WALL_ANTIALIASING))[..., 3].copy()
+    rng = np.random.default_rng((diameter, shape))
+    size = diameter * BLOOD_WALL_ANTIALIASING
+    img = Image.new('L', (size, size), 0)
+    draw = ImageDraw.Draw(img)
+    center = size / 2
+    blob = size * rng.uniform(0.25, 0.35)
+    draw.ellipse((center - blob, center - blob, center + blob, center + blob), fill=255)
+    for i in range(int(rng.integers(3, 7))):
+        radius = size * rng.uniform(0.05, 0.12)
+        distance = rng.uniform(0.8 * blob, center - radius)
+        angle = rng.uniform(0, 2 * np.pi)
+        x, y = center + distance * np.cos(angle), center + distance * np.sin(angle)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=255)
+    return np.asarray(img.resize((diameter, diameter), Image.Resampling.BICUBIC)).copy()
+
+
+class StampBank:
+    """Premultiplied splatter stamps by (diameter, color, shape). The coverage of every diameter and shape is
+    rendered once, stamps are colored from it. `warm` makes the stamps of all particle sizes and palette colors."""
+
+    def __init__(self, shapes: int = BLOOD_SPLATTER_SHAPES):
+        self.shapes = shapes
+        self.masks: dict[tuple[int, int], np.ndarray] = {}
+        self.stamps: dict[tuple[int, tuple[int, int, int], int], np.ndarray] = {}
+
+    @staticmethod
+    def diameter(radius: float) -> int:
+        """Diameter of the splatter of a particle with `radius`"""
+        return int(radius * BLOOD_WALL_SIZE_MULTIPLIER * 2)
+
+    def get(self, radius: float, color: tuple[int, int, int]) -> np.ndarray:
+        """Stamp of a particle. The shape is picked by the radius, all sprites a particle hits get the same one."""
+        shape = int(radius * 1e6) % self.shapes
+        key = (self.diameter(radius), tuple(color[:3]), shape)
+        stamp = self.stamps.get(key)
+        if stamp is None:
+            stamp = self.stamps[key] = self._make_stamp(*key)
+        return stamp
+
+    def _make_stamp(self, diameter: int, color: tuple[int, int, int], shape: int) -> np.ndarray:
+        mask = self.masks.get((diameter, shape))
+        if mask is None:
+            mask = self.masks[(diameter, shape)] = splatter_mask(diameter, shape)
+        stamp = np.empty(mask.shape + (4,), dtype=np.uint16)
+        stamp[...] = mask[..., None]
+        stamp[..., :3] *= np.array(color, dtype=np.uint16)
+        div255(stamp[..., :3])
+        return stamp.astype(np.uint8)
+
+    def warm(self):
+        """Make the stamps of all particle sizes, palette colors and shapes (no-op once done)"""
+        for diameter in range(self.diameter(BLOOD_PARTICLE_SIZE_MIN), self.diameter(BLOOD_PARTICLE_SIZE_MIN + BLOOD_PARTICLE_SIZE_RANGE) + 1):
+            for shade in range(BLOOD_PARTICLE_SHADES):
+                for dark in (True, False):
+                    color = ParticleSprite.palette_color(shade, dark)
+                    for shape in range(self.shapes):
+                        if (diameter, color, shape) not in self.stamps:
+                            self.stamps[(diameter, color, shape)] = self._make_stamp(diameter, color, shape)
+
+
+class SplatterBuffer:
+    """Pixels (premultiplied uint8, [y,x,c] order) of the splatter texture of one sprite"""
+
+    def __init__(self, texture: arcade.Texture, original: arcade.Texture, recycled: bool = False):
+        """`texture` gets a copy of the image of `original`, the texture of the sprite before it was splattered.
+        A `recycled` texture still has the pixels of another sprite in the atlas, it is uploaded completely."""
+        self.texture = texture
+        self.original = original
+        texture.image = original.image.convert('RGBA')
+        self.pixels = premultiply(np.asarray(texture.image))
+        # (x1, y1, x2, y2) in image coordinates that changed since the last upload
+        self.dirty: Optional[tuple[int, int, int, int]] = None
+        if recycled:
+            self.dirty = (0, 0, texture.image.width, texture.image.height)
+
+    @staticmethod
+    def size_in_bytes(width: int, height: int) -> int:
+        """Memory of a buffer and its texture image"""
+        return width * height * 4 * 2
+
+    @property
+    def nbytes(self) -> int:
+        return self.size_in_bytes(self.texture.image.width, self.texture.image.height)
+
+    def stamp_many(self, stamps: list[tuple[np.ndarray, tuple[int, int]]], compositor: Compositor):
+        """Composite the (stamp, top left corner) pairs (premultiplied) in order, masked with the alpha of the
+        sprite, and mark the rectangle covering all of them dirty"""
+        rect = compositor.stamp_many(self.pixels, stamps, mask=True)
+        if rect is None:
+            return
+        x1, y1, x2, y2 = rect
+        if self.dirty is None:
+            self.dirty = rect
+        else:
+            dx1, dy1, dx2, dy2 = self.dirty
+            self.dirty = (min(x1, dx1), min(y1, dy1), max(x2, dx2), max(y2, dy2))
+
+    def upload(self, atlas: arcade.TextureAtlas):
+        """Write the dirty rectangle to the texture image and, if the texture is in it already, to the atlas"""
+        if self.dirty is None:
+            return
+        x1, y1, x2, y2 = self.dirty
+        self.dirty = None
+        data = unpremultiply(self.pixels[y1:y2, x1:x2])
+        # The atlas is rebuilt from the images (e.g. when it grows), keep them up to date as well
+        self.texture.image.paste(Image.fromarray(data), (x1, y1))
+        if atlas.has_texture(self.texture):
+            # Images are stored top row first in the atlas, so image and atlas rows have the same direction
+            region = atlas.get_region_info(self.texture.name)
+            atlas.texture.write(data.tobytes(), 0, viewport=(region.x + x1, region.y + y1, x2 - x1, y2 - y1))
+
+
+class SplatterStore:
+    """Splatter buffers of the splattered sprites. To stay within the texture and memory budgets the least recently
+    splattered sprites get their original texture back. Their textures keep their place in the atlas and are reused
+    for the next sprites of the same size, so the atlas does not grow during long sessions. Free textures beyond the
+    texture budget are removed from the atlas, their space is reclaimed with a rebuild of the atlas once it adds up to
+    `rebuild_share` of it."""
+
+    def __init__(self, atlas: arcade.TextureAtlas, frame_budget: Optional[float] = BLOOD_SPLATTER_FRAME_BUDGET,
+                 max_textures: int = BLOOD_SPLATTER_MAX_TEXTURES, max_memory: int = BLOOD_SPLATTER_MAX_MEMORY,
+                 rebuild_share: float = BLOOD_SPLATTER_ATLAS_REBUILD):
+        self.atlas = atlas
+        self.frame_budget = frame_budget
+        self.max_textures = max_textures
+        self.max_memory = max_memory
+        self.rebuild_share = rebuild_share
+        # (sprite, position in the sprite, particle radius, particle color) not painted yet
+        self.pending: deque[tuple[arcade.Sprite, tuple[float, float], float, tuple[int, int, int]]] = deque()
+        # Least recently splattered first
+        self.buffers: OrderedDict[arcade.Sprite, SplatterBuffer] = OrderedDict()
+        self.dirty: set[SplatterBuffer] = set()
+        self.compositor = Compositor()
+        self.stamps = StampBank()
+        # Textures of released buffers by image size
+        self.free_textures: dict[tuple[int, int], list[arcade.Texture]] = {}
+        self.memory = 0
+        self.evictions = 0
+        # Atlas pixels of removed splatter textures that are not reclaimed yet
+        self.removed_area = 0
+        self.rebuilds = 0
+        self.counter = 0
+
+    def enqueue(self, sprite: arcade.Sprite, center: tuple[float, float], radius: float, color: tuple[int, int, int]):
+        """Remember a splatter of a particle at `center` (sprite coordinates) for the next paint"""
+        self.pending.append((sprite, center, radius, color))
+
+    def paint(self):
+        """Paint pending splatters until the frame budget is used up, then upload the changes. The pending
+        splatters are grouped by sprite (in order per sprite) and every sprite is stamped in one go, the budget is
+        checked between sprites. The budget covers the painting, the uploads (one per changed sprite) are not limited."""
+        start = time.perf_counter()
+        groups: dict[arcade.Sprite, list[tuple[tuple[float, float], float, tuple[int, int, int]]]] = {}
+        while self.pending:
+            sprite, center, radius, color = self.pending.popleft()
+            groups.setdefault(sprite, []).append((center, radius, color))
+
+        sprites = list(groups)
+        for i, sprite in enumerate(sprites):
+            # Not for sprites removed in the meantime (e.g. spawned items)
+            if sprite.sprite_lists:
+                self.stamp_many(sprite, [(self.stamps.get(radius, color), center) for center, radius, color in groups[sprite]])
+            if self.frame_budget is not None and time.perf_counter() - start > self.frame_budget:
+                # The rest goes back to the front of the queue for the next frame
+                self.pending.extendleft((sprite, *record) for sprite in reversed(sprites[i + 1:])
+                                        for record in reversed(groups[sprite]))
+                break
+        self.upload()
+
+    def stamp_many(self, sprite: arcade.Sprite, stamps: list[tuple[np.ndarray, tuple[float, float]]]):
+        """Stamp the (stamp, center) pairs onto `sprite` in order, centers are in sprite coordinates (origin bottom left)"""
+        buffer = self.buffers.get(sprite)
+        if buffer is None:
+            buffer = self._create_buffer(sprite)
+        else:
+            self.buffers.move_to_end(sprite)
+
+        height, width = buffer.pixels.shape[:2]
+        pos_in_image = np.array([center for stamp, center in stamps], dtype=float) * (width / sprite.width, height / sprite.height)
+        pos_in_image[:, 1] = height - pos_in_image[:, 1]
+        # Draw centered
+        pos_in_image -= np.array([(stamp.shape[1], stamp.shape[0]) for stamp, center in stamps]) / 2
+        positions = [(stamp, tuple(pos)) for (stamp, center), pos in zip(stamps, pos_in_image.astype(int).tolist())]
+        buffer.stamp_many(positions, self.compositor)
+        if buffer.dirty is not None:
+            self.dirty.add(buffer)
+
+    def _create_buffer(self, sprite: arcade.Sprite) -> SplatterBuffer:
+        """Give `sprite` a splatter texture of its own, a copy of its current one"""
+        original = sprite.texture
+        size = original.image.size
+        self._make_room(SplatterBuffer.size_in_bytes(*size))
+
+        free = self.free_textures.get(size)
+        if free:
+            buffer = SplatterBuffer(free.pop(), original, recycled=True)
+        else:
+            self._drop_free_textures(self.max_textures - len(self.buffers) - 1)
+            buffer = SplatterBuffer(arcade.Texture(f'splatter_{self.counter}', original.image), original)
+            self.counter += 1
+        self.buffers[sprite] = buffer
+        self.memory += buffer.nbytes
+        if buffer.dirty is not None:
+            self.dirty.add(buffer)
+
+        # HACK: just restore sprite size (gets reset on texture change)
+        sprite_size = sprite.width, sprite.height
+        sprite.texture = buffer.texture
+        sprite.width, sprite.height = sprite_size
+        return buffer
+
+    def _make_room(self, nbytes: int):
+        """Release the least recently splattered buffers until one more of `nbytes` fits into the budgets"""
+        while self.buffers and (len(self.buffers) >= self.max_textures or self.memory + nbytes > self.max_memory):
+            self._release(*self.buffers.popitem(last=False))
+            self.evictions += 1
+
+    def _release(self, sprite: arcade.Sprite, buffer: SplatterBuffer):
+        """Give `sprite` its original texture back and keep the splatter texture for reuse"""
+        self.memory -= buffer.nbytes
+        self.dirty.discard(buffer)
+        if sprite.texture is buffer.texture:
+            sprite_size = sprite.width, sprite.height
+            sprite.texture = buffer.original
+            sprite.width, sprite.height = sprite_size
+        self.free_textures.setdefault(buffer.texture.image.size, []).append(buffer.texture)
+
+    def _drop_free_textures(self, keep: int):
+        """Remove free textures (of other sizes) from the atlas until at most `keep` are left"""
+        for textures in self.free_textures.values():
+            while textures and self.free_count > max(keep, 0):
+                texture = textures.pop()
+                if self.atlas.has_texture(texture):
+                    self.removed_area += self._atlas_area(texture)
+                    self.atlas.remove(texture)
+        if self.removed_area > self.rebuild_share * self.atlas.width * self.atlas.height:
+            # Repacks the remaining textures from their images (the splatter images are kept up to date)
+            self.atlas.rebuild()
+            self.removed_area = 0
+            self.rebuilds += 1
+
+    def _atlas_area(self, texture: arcade.Texture) -> int:
+        """Pixels `texture` takes in the atlas (including its border)"""
+        region = self.atlas.get_region_info(texture.name)
+        return (region.width + 2 * self.atlas.border) * (region.height + 2 * self.atlas.border)
+
+    @property
+    def free_count(self) -> int:
+        return sum(len(textures) for textures in self.free_textures.values())
+
+    def upload(self):
+        """Write the changes since the last call to the atlas"""
+        for buffer in self.dirty:
+            buffer.upload(self.atlas)
+        self.dirty.clear()
+
+    def metrics(self) -> dict:
+        """Occupancy of the store, the atlas shares are of its current size"""
+        textures = [buffer.texture for buffer in self.buffers.values()]
+        textures.extend(texture for free in self.free_textures.values() for texture in free)
+        atlas_area = self.atlas.width * self.atlas.height
+        return {
+            'textures': len(self.buffers),
+            'max_textures': self.max_textures,
+            'memory': self.memory,
+            'max_memory': self.max_memory,
+            'free_textures': self.free_count,
+            'evictions': self.evictions,
+            'pending': len(self.pending),
+            'atlas_share': sum(self._atlas_area(texture) for texture in textures if self.atlas.has_texture(texture)) / atlas_area,
+            'atlas_removed_share': self.removed_area / atlas_area,
+            'atlas_rebuilds': self.rebuilds,
+        }
+
+    def clear(self):
+        """Release all buffers (when the level changes), their textures are kept for the next level"""
+        self.pending.clear()
+        while self.buffers:
+            self._release(*self.buffers.popitem(last=False))
+        self.dirty.clear()
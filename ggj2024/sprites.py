@@ -6,15 +6,17 @@ import time
 
 from ggj2024.config import *
 from ggj2024.utils import *
-from ggj2024.spriteset import Spriteset
+from ggj2024.spriteset import Spriteset, LazySpriteset
 from ggj2024.physics_engine import PhysicsEngine
+from ggj2024 import hitboxcache
 
 
 
 class SPRITESETS:
-    GENERAL: Spriteset = Spriteset.load('assets/General.tsx', 0)
-    ALL_FOR_ONE: Spriteset = Spriteset.load('assets/AllForOne.tsx', 0)
-    PLAYER_CONTROLLED_PLATFORMS = Spriteset.load('assets/PlayerControlledPlatforms.tsx', 0)
+    # Tilesets are parsed on first access
+    GENERAL: Spriteset = LazySpriteset('assets/General.tsx', 0)
+    ALL_FOR_ONE: Spriteset = LazySpriteset('assets/AllForOne.tsx', 0)
+    PLAYER_CONTROLLED_PLATFORMS: Spriteset = LazySpriteset('assets/PlayerControlledPlatforms.tsx', 0)
 
 from ggj2024.config import *
 from ggj2024.utils import *
@@ -23,8 +25,9 @@ from ggj2024.utils import *
 class PlayerSprite(arcade.Sprite):
     """ Player Sprite """
     def __init__(self,
-                 hit_box_algorithm):
-        """ Init """
+                 hit_box_algorithm="None"):
+        """ Init
+        The hit box is hand-written below, only pass an algorithm other than "None" if the textures' own hit boxes are needed."""
         # Let parent initialize
         super().__init__()
 
@@ -34,18 +37,18 @@ class PlayerSprite(arcade.Sprite):
         main_path = "resources/images/characters/mickey"
 
         # Load textures for idle standing
-        self.idle_texture_pair = arcade.load_texture_pair(f"{main_path}/idle.png",
-                                                          hit_box_algorithm=hit_box_algorithm)
-        self.jump_texture_pair = arcade.load_texture_pair(f"{main_path}/jump.png",
-                                                          hit_box_algorithm=hit_box_algorithm)
-        self.fall_texture_pair = arcade.load_texture_pair(f"{main_path}/fall.png",
-                                                          hit_box_algorithm=hit_box_algorithm)
+        self.idle_texture_pair = hitboxcache.load_texture_pair(f"{main_path}/idle.png",
+                                                               hit_box_algorithm=hit_box_algorithm)
+        self.jump_texture_pair = hitboxcache.load_texture_pair(f"{main_path}/jump.png",
+                                                               hit_box_algorithm=hit_box_algorithm)
+        self.fall_texture_pair = hitboxcache.load_texture_pair(f"{main_path}/fall.png",
+                                                               hit_box_algorithm=hit_box_algorithm)
 
         # Load textures for walking
         self.walk_textures = []
         for i in range(1, 9):
-            texture = arcade.load_texture_pair(f"{main_path}/walk{i}.png",
-                                                          hit_box_algorithm=hit_box_algorithm)
+            texture = hitboxcache.load_texture_pair(f"{main_path}/walk{i}.png",
+                                                    hit_box_algorithm=hit_box_algorithm)
             self.walk_textures.append(texture)
 
         # Set the initial texture
@@ -154,25 +157,51 @@ class PlayerControlledPlatformSprite(arcade.Sprite):
 class ParticleSprite(arcade.Sprite):
     COLLISION_TYPE = 'particle'
     DISABLED_COLLISIONS = ['player', 'platform', 'particle']
-    
-    def __init__(self, x, y, radius, mass=1, liftetime=BLOOD_LIFETIME):
-        color_var = int(np.random.random() * BLOOD_COLOR_VARIATION)
-        if np.random.rand() < 0.5:
-            color = (255 - color_var, 0, 0)
-        else:
-            color = (255, color_var, color_var)
+    # Textures by (diameter, color), shared by all particles. Filled by warm_textures or on first use
+    TEXTURES: dict[tuple[int, tuple[int, int, int]], arcade.Texture] = {}
+
+    def __init__(self, x, y, radius, mass=1, liftetime=BLOOD_LIFETIME, spawn_time: float | None = None):
+        shade = int(np.random.random() * BLOOD_PARTICLE_SHADES)
+        color = ParticleSprite.palette_color(shade, dark=np.random.rand() < 0.5)
         diameter = int(2*radius)
-        self.texture_name = f'particle_{diameter}_{color[0]}_{color[1]}_{color[2]}'
-        img = create_circle_image(diameter, color, BLOOD_PARTICLE_ANTIALIASING)
-        texture = arcade.Texture(self.texture_name, img)
+        texture = ParticleSprite.get_texture(diameter, color)
+        self.texture_name = texture.name
 
         super().__init__(center_x=x, center_y=y, texture=texture)
         self.radius = radius
         self.color = color
-        self.killtime = time.time() + liftetime
+        # Simulations pass their own clock, so particles expire in simulated time
+        self.killtime = (time.time() if spawn_time is None else spawn_time) + liftetime
         # Let every 2nd sprite ignore background so that the grass won't catch all the blood
         self.ignore_background = np.random.rand() > 0.5
     
+    @staticmethod
+    def palette_color(shade: int, dark: bool) -> tuple[int, int, int]:
+        """One of the BLOOD_PARTICLE_SHADES shades of the dark or the light red"""
+        color_var = shade * BLOOD_COLOR_VARIATION // BLOOD_PARTICLE_SHADES
+        if dark:
+            return (255 - color_var, 0, 0)
+        return (255, color_var, color_var)
+
+    @classmethod
+    def get_texture(cls, diameter: int, color: tuple[int, int, int]) -> arcade.Texture:
+        texture = cls.TEXTURES.get((diameter, color))
+        if texture is None:
+            img = create_circle_image(diameter, color, BLOOD_PARTICLE_ANTIALIASING)
+            texture = arcade.Texture(f'particle_{diameter}_{color[0]}_{color[1]}_{color[2]}', img)
+            # Hit boxes are computed on first use, do it now as well
+            texture.hit_box_points
+            cls.TEXTURES[(diameter, color)] = texture
+        return texture
+
+    @classmethod
+    def warm_textures(cls):
+        """Render the textures of all particle sizes and colors, so spawning particles creates no images"""
+        for diameter in range(int(2 * BLOOD_PARTICLE_SIZE_MIN), int(2 * (BLOOD_PARTICLE_SIZE_MIN + BLOOD_PARTICLE_SIZE_RANGE)) + 1):
+            for shade in range(BLOOD_PARTICLE_SHADES):
+                for dark in (True, False):
+                    cls.get_texture(diameter, cls.palette_color(shade, dark))
+
     def register_physics_engine(self, physics_engine):
         super().register_physics_engine(physics_engine)
         if isinstance(physics_engine, PhysicsEngine):
@@ -18,6 +18,14 @@ import arcade
 from arcade import Point
 from arcade.tilemap.tilemap import _get_image_info_from_tileset, _get_image_source
 
+from ggj2024.config import *
+from ggj2024 import diskcache, hitboxcache
+from ggj2024.profiling import PROFILER
+
+
+TILESET_CACHE_MAGIC = b'GGJTSX'
+TILESET_CACHE_VERSION = 1
+
 
 def parse_pytiled_tileset(filename: str | Path, first_gid: int) -> pytiled_parser.Tileset:
     """first_gid means "first global ID" but I don't really know it this is important here."""
@@ -29,6 +37,22 @@ def parse_pytiled_tileset(filename: str | Path, first_gid: int) -> pytiled_parse
             # external_path=tileset_path.parent,
         )
 
+
+def load_pytiled_tileset(filename: str | Path, first_gid: int) -> pytiled_parser.Tileset:
+    """Like `parse_pytiled_tileset` but memoized on disk, so the XML is only parsed when the file changed"""
+    if not TILESET_CACHE_ENABLED:
+        return parse_pytiled_tileset(filename, first_gid)
+    cache_file = Path(TILESET_CACHE_DIR) / f'{Path(filename).stem}.{diskcache.cache_key(Path(filename).resolve(), first_gid)}.tileset'
+    tileset = diskcache.read_cache(cache_file, TILESET_CACHE_MAGIC, TILESET_CACHE_VERSION)
+    if tileset is None:
+        tileset = parse_pytiled_tileset(filename, first_gid)
+        try:
+            diskcache.write_cache(cache_file, TILESET_CACHE_MAGIC, TILESET_CACHE_VERSION,
+                                  [diskcache.file_dependency(filename)], tileset)
+        except OSError as err:
+            print(f'WARNING: Could not write tileset cache {cache_file}:', err)
+    return tileset
+
 def convert_hitbox_to_points(hitbox: pytiled_parser.tiled_object.TiledObject, 
                              sprite_size: tuple[int, int], 
                              scaling: float = 1.0,
@@ -159,7 +183,7 @@ class Spriteset():
     @staticmethod
     def load(filename: str | Path, first_gid: int):
         """first_gid means "first global ID" but I don't really know it this is important here."""
-        tileset = parse_pytiled_tileset(filename, first_gid)
+        tileset = load_pytiled_tileset(filename, first_gid)
         return Spriteset(tileset, filename)
 
 
@@ -194,7 +218,7 @@ class Spriteset():
         # No need to calculate hitbox if we already have one
         if hitbox is not None:
             hit_box_algorithm = 'None'
-        texture = arcade.load_texture(
+        texture = hitboxcache.load_texture(
             image_file,
             image_x,
             image_y,
@@ -259,19 +283,11 @@ class Spriteset():
                     Custom classes for tiles must subclass arcade.Sprite.
                     """
                 )
-            image_x, image_y, width, height = self._get_image_info_from_tile(tile)
+            # Load the texture through the hit box cache instead of letting the sprite load it
+            texture = self.create_texture(tile, scaling, hit_box_algorithm, hit_box_detail)
             args = {
-                "filename": image_file,
+                "texture": texture,
                 "scale": scaling,
-                "image_x": image_x,
-                "image_y": image_y,
-                "image_width": width,
-                "image_height": height,
-                "flipped_horizontally": tile.flipped_horizontally,
-                "flipped_vertically": tile.flipped_vertically,
-                "flipped_diagonally": tile.flipped_diagonally,
-                "hit_box_algorithm": hit_box_algorithm,  # type: ignore
-                "hit_box_detail": hit_box_detail,
             }
             my_sprite = custom_class(**custom_class_args, **args)  # type: ignore
 
@@ -347,3 +363,18 @@ class Spriteset():
             height = tile.height
 
         return image_x, image_y, width, height
+
+
+class LazySpriteset:
+    """Class attribute that loads its Spriteset on first access instead of at import time"""
+
+    def __init__(self, filename: str | Path, first_gid: int):
+        self.filename = filename
+        self.first_gid = first_gid
+        self._spriteset: Optional[Spriteset] = None
+
+    def __get__(self, obj, objtype=None) -> Spriteset:
+        if self._spriteset is None:
+            with PROFILER.section(f'load spriteset {self.filename}'):
+                self._spriteset = Spriteset.load(self.filename, self.first_gid)
+        return self._spriteset
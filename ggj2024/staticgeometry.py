@@ -0,0 +1,152 @@
+"""Merged colliders for static tiles.
+
+Adding every tile as its own body and shape makes the broadphase scale with the size of the level.
+Here adjacent square tiles of a layer are merged into rectangles (runs of tiles in a row, stacked if the
+runs of consecutive rows line up), so a platform of 20 tiles becomes a single box. Every block remembers
+its tiles, so a contact point can be mapped back to the tile that was hit.
+"""
+import math
+from typing import Iterable, Iterator, Optional
+
+import pymunk
+from arcade import Sprite
+
+
+# Max. deviation (in pixels) of a hit box / position from the tile grid that still counts as aligned
+GRID_TOLERANCE = 0.01
+
+
+class TileBlock:
+    """Rectangle of equally sized tiles covered by a single box shape"""
+
+    def __init__(self, left: float, bottom: float, tile_width: float, tile_height: float, tiles: list[list[Sprite]]):
+        self.left = left
+        self.bottom = bottom
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        # tiles[row][col], row 0 is the bottom row
+        self.tiles = tiles
+        self.shape: Optional[pymunk.Shape] = None
+
+    @property
+    def rows(self) -> int:
+        return len(self.tiles)
+
+    @property
+    def cols(self) -> int:
+        return len(self.tiles[0])
+
+    @property
+    def right(self) -> float:
+        return self.left + self.cols * self.tile_width
+
+    @property
+    def top(self) -> float:
+        return self.bottom + self.rows * self.tile_height
+
+    def corners(self) -> list[tuple[float, float]]:
+        return [(self.left, self.bottom), (self.right, self.bottom), (self.right, self.top), (self.left, self.top)]
+
+    def sprites(self) -> Iterator[Sprite]:
+        for row in self.tiles:
+            yield from row
+
+    def _index(self, value: float, start: float, size: float, n: int) -> int:
+        return min(max(math.floor((value - start) / size), 0), n - 1)
+
+    def tile_at(self, point: tuple[float, float]) -> Sprite:
+        """The tile containing `point`, or the closest one if it is outside of the block"""
+        x, y = point
+        return self.tiles[self._index(y, self.bottom, self.tile_height, self.rows)][self._index(x, self.left, self.tile_width, self.cols)]
+
+    def tiles_near(self, point: tuple[float, float], distance: float) -> list[Sprite]:
+        """All tiles that are at most `distance` away from `point`"""
+        x, y = point
+        col_range = range(self._index(x - distance, self.left, self.tile_width, self.cols),
+                          self._index(x + distance, self.left, self.tile_width, self.cols) + 1)
+        tiles = []
+        for row in range(self._index(y - distance, self.bottom, self.tile_height, self.rows),
+                         self._index(y + distance, self.bottom, self.tile_height, self.rows) + 1):
+            tile_bottom = self.bottom + row * self.tile_height
+            dy = max(tile_bottom - y, 0, y - tile_bottom - self.tile_height)
+            for col in col_range:
+                tile_left = self.left + col * self.tile_width
+                dx = max(tile_left - x, 0, x - tile_left - self.tile_width)
+                if dx * dx + dy * dy <= distance * distance:
+                    tiles.append(self.tiles[row][col])
+        return tiles
+
+
+def is_box_tile(sprite: Sprite) -> bool:
+    """Whether the hit box of the sprite is its full, axis aligned rectangle"""
+    if sprite.angle % 360 != 0:
+        return False
+    points = sprite.get_hit_box()
+    if len(points) != 4:
+        return False
+    half_width, half_height = sprite.width / 2, sprite.height / 2
+    corners = set()
+    for x, y in points:
+        x, y = x * sprite.scale, y * sprite.scale
+        if abs(abs(x) - half_width) > GRID_TOLERANCE or abs(abs(y) - half_height) > GRID_TOLERANCE:
+            return False
+        corners.add((x > 0, y > 0))
+    return len(corners) == 4
+
+
+def _runs(cols: list[int]) -> Iterator[tuple[int, int]]:
+    """(first, last) of every run of consecutive numbers in a sorted list"""
+    first = last = cols[0]
+    for col in cols[1:]:
+        if col != last + 1:
+            yield first, last
+            first = col
+        last = col
+    yield first, last
+
+
+def merge_box_tiles(sprites: Iterable[Sprite]) -> tuple[list[TileBlock], list[Sprite]]:
+    """Merge adjacent box tiles into rectangular blocks.
+    Returns the blocks and the sprites that can not be merged (other hit boxes, rotated, off the grid).
+    """
+    # (tile width, tile height) -> row -> col -> sprite
+    grids: dict[tuple[float, float], dict[int, dict[int, Sprite]]] = {}
+    rest = []
+    for sprite in sprites:
+        if not is_box_tile(sprite):
+            rest.append(sprite)
+            continue
+        width, height = sprite.width, sprite.height
+        left, bottom = sprite.center_x - width / 2, sprite.center_y - height / 2
+        col, row = round(left / width), round(bottom / height)
+        grid = grids.setdefault((width, height), {})
+        if abs(col * width - left) > GRID_TOLERANCE or abs(row * height - bottom) > GRID_TOLERANCE or col in grid.get(row, {}):
+            rest.append(sprite)
+            continue
+        grid.setdefault(row, {})[col] = sprite
+
+    blocks = []
+    for (width, height), grid in grids.items():
+        # (first col, last col) -> [first row, tile rows] of the blocks that reach up to the previous row
+        open_blocks: dict[tuple[int, int], list] = {}
+        finished = []
+        previous_row = None
+        for row in sorted(grid):
+            if previous_row != row - 1:
+                finished.extend(open_blocks.values())
+                open_blocks = {}
+            grid_row = grid[row]
+            extended = {}
+            for first, last in _runs(sorted(grid_row)):
+                block = open_blocks.pop((first, last), None) or [row, []]
+                block[1].append([grid_row[col] for col in range(first, last + 1)])
+                extended[first, last] = block
+            finished.extend(open_blocks.values())
+            open_blocks = extended
+            previous_row = row
+        finished.extend(open_blocks.values())
+
+        for first_row, tiles in finished:
+            left = round((tiles[0][0].center_x - width / 2) / width) * width
+            blocks.append(TileBlock(left, first_row * height, width, height, tiles))
+    return blocks, rest
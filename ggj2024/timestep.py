@@ -0,0 +1,43 @@
+class FixedTimestep:
+    """Runs a fixed size simulation step as often as needed to keep up with real time.
+
+    Every frame `advance(delta_time)` adds the elapsed time and returns how many steps to run. Time that
+    is not simulated yet carries over to the next frame, `alpha` is its fraction of a step, use it to blend
+    between the last two simulation states when drawing.
+    If a frame would need more than `max_steps` steps, the rest of the time is dropped (the game slows down
+    instead of needing ever more steps per frame to catch up).
+    """
+
+    # Tolerance for floating point errors (60 fps with a step of 1/240 s must give exactly 4 steps)
+    EPSILON = 1e-9
+
+    def __init__(self, step_size: float, max_steps: int):
+        self.step_size = step_size
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+
+        # Counters
+        self.steps = 0
+        self.dropped_time = 0.0
+
+    def advance(self, delta_time: float) -> int:
+        """Add the elapsed time, returns the number of steps to run now"""
+        self.accumulator += delta_time
+        steps = int(self.accumulator / self.step_size + self.EPSILON)
+        if steps > self.max_steps:
+            steps = self.max_steps
+            # Drop all the time that can not be simulated in this frame
+            self.dropped_time += self.accumulator - steps * self.step_size
+            self.accumulator = steps * self.step_size
+        self.accumulator = max(0.0, self.accumulator - steps * self.step_size)
+        self.steps += steps
+        return steps
+
+    @property
+    def alpha(self) -> float:
+        """Fraction of a step of the time that has not been simulated yet (0 <= alpha < 1)"""
+        return min(self.accumulator / self.step_size, 1.0)
+
+    def reset(self):
+        """Forget the time that has not been simulated yet, e.g. after loading a level"""
+        self.accumulator = 0.0
@@ -0,0 +1,123 @@
+"""The fixed point compositing of ggj2024.compositing against the float reference in ggj2024.utils"""
+import numpy as np
+import pytest
+
+from ggj2024.compositing import Compositor, premultiply, unpremultiply
+from ggj2024.utils import alpha_composite, create_circle_image
+
+
+def reference(dest: np.ndarray, stamp: np.ndarray, pos: tuple[int, int], mask: bool) -> np.ndarray:
+    """utils.alpha_composite of the premultiplied uint8 images (converted back to straight alpha), premultiplied and
+    rounded like the fixed point result"""
+    straight_dest, straight_stamp = (image.astype(float) / 255 for image in (dest, stamp))
+    for image in (straight_dest, straight_stamp):
+        image[..., :3] /= np.maximum(image[..., 3:], 1 / 255)
+    result = alpha_composite(straight_dest, straight_stamp, pos, mask_fg_with_bg=mask)
+    result[..., :3] *= result[..., 3:]
+    return np.round(result * 255).astype(int)
+
+
+def random_case(rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray, tuple[int, int]]:
+    """A tile with opaque, transparent and translucent pixels and a circle splatter that may stick out of it"""
+    size = int(rng.integers(8, 65))
+    tile = rng.integers(0, 256, (size, size, 4), dtype=np.uint8)
+    tile[..., 3] = rng.choice([0, 255, int(rng.integers(1, 255))], size=(size, size))
+    color = tuple(int(c) for c in rng.integers(0, 256, 3)) + (int(rng.integers(1, 256)),)
+    splatter = np.array(create_circle_image(int(rng.integers(2, 40)), color, 4))
+    pos = tuple(int(p) for p in rng.integers(-splatter.shape[0], size, 2))
+    return premultiply(tile), premultiply(splatter), pos
+
+
+def solid(size: int, color: tuple[int, int, int], alpha: int) -> np.ndarray:
+    image = np.empty((size, size, 4), dtype=np.uint8)
+    image[...] = color + (alpha,)
+    return premultiply(image)
+
+
+@pytest.mark.parametrize('mask', [False, True])
+def test_stamp_matches_float_reference(mask):
+    rng = np.random.default_rng(0)
+    compositor = Compositor()
+    off_by_one = pixels = 0
+    for i in range(200):
+        dest, stamp, pos = random_case(rng)
+        expected = reference(dest, stamp, pos, mask)
+        before = dest.copy()
+        rect = compositor.stamp(dest, stamp, pos, mask)
+        error = np.abs(dest.astype(int) - expected)
+        assert error.max() <= 1
+        off_by_one += np.count_nonzero(error)
+        pixels += error.size
+
+        # Nothing outside of the returned rectangle changes
+        if rect is not None:
+            x1, y1, x2, y2 = rect
+            before[y1:y2, x1:x2] = dest[y1:y2, x1:x2]
+        np.testing.assert_array_equal(dest, before)
+    # Rounded once, like the reference, an error of 1 LSB only comes from float ties
+    assert off_by_one <= pixels // 1000
+
+
+@pytest.mark.parametrize('mask', [False, True])
+def test_stamp_many_matches_single_stamps(mask):
+    rng = np.random.default_rng(1)
+    dest, _, _ = random_case(rng)
+    stamps = []
+    for i in range(20):
+        _, stamp, pos = random_case(rng)
+        stamps.append((stamp, pos))
+
+    expected = dest.copy()
+    compositor = Compositor()
+    rects = [compositor.stamp(expected, stamp, pos, mask) for stamp, pos in stamps]
+    rects = [rect for rect in rects if rect is not None]
+
+    rect = compositor.stamp_many(dest, stamps, mask)
+    np.testing.assert_array_equal(dest, expected)
+    assert rect == (min(r[0] for r in rects), min(r[1] for r in rects), max(r[2] for r in rects), max(r[3] for r in rects))
+
+
+@pytest.mark.parametrize('mask', [False, True])
+def test_stamp_many_outside(mask):
+    dest = solid(16, (10, 20, 30), 255)
+    stamp = solid(4, (255, 0, 0), 255)
+    assert Compositor().stamp_many(dest, [(stamp, (16, 0)), (stamp, (-4, -4))], mask) is None
+    np.testing.assert_array_equal(dest, solid(16, (10, 20, 30), 255))
+    assert Compositor().stamp_many(dest, [], mask) is None
+
+
+@pytest.mark.parametrize('mask', [False, True])
+def test_transparent_stamp(mask):
+    dest = solid(16, (10, 20, 30), 128)
+    assert Compositor().stamp(dest, solid(8, (255, 0, 0), 0), (4, 4), mask) == (4, 4, 12, 12)
+    np.testing.assert_array_equal(dest, solid(16, (10, 20, 30), 128))
+
+
+@pytest.mark.parametrize('mask', [False, True])
+def test_opaque_stamp_on_opaque_dest(mask):
+    dest = solid(16, (10, 20, 30), 255)
+    Compositor().stamp(dest, solid(8, (200, 0, 50), 255), (-4, 12), mask)
+    np.testing.assert_array_equal(dest[12:, :4], solid(4, (200, 0, 50), 255))
+    dest[12:, :4] = solid(4, (10, 20, 30), 255)
+    np.testing.assert_array_equal(dest, solid(16, (10, 20, 30), 255))
+
+
+def test_stamp_on_transparent_dest():
+    # Unmasked the stamp is pasted as it is, masked it does not show at all
+    stamp = solid(8, (200, 0, 50), 255)
+    dest = solid(8, (0, 0, 0), 0)
+    Compositor().stamp(dest, stamp, (0, 0))
+    np.testing.assert_array_equal(dest, stamp)
+
+    dest = solid(8, (0, 0, 0), 0)
+    Compositor().stamp(dest, stamp, (0, 0), mask=True)
+    np.testing.assert_array_equal(dest, solid(8, (0, 0, 0), 0))
+
+
+def test_premultiply_roundtrip():
+    image = np.random.default_rng(2).integers(0, 256, (32, 32, 4), dtype=np.uint8)
+    image[:16, :, 3] = 255
+    image[16:, :, 3] = 0
+    result = unpremultiply(premultiply(image))
+    np.testing.assert_array_equal(result[:16], image[:16])
+    np.testing.assert_array_equal(result[16:], 0)
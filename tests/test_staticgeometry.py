@@ -0,0 +1,44 @@
+"""Merging of box tiles in ggj2024.staticgeometry"""
+import arcade
+
+from ggj2024.staticgeometry import merge_box_tiles
+
+
+def tile(center_x: float, center_y: float, size: int = 32) -> arcade.Sprite:
+    sprite = arcade.SpriteSolidColor(size, size, (255, 255, 255))
+    sprite.position = center_x, center_y
+    return sprite
+
+
+def test_off_grid_tile():
+    sprite = tile(21, 16)
+    blocks, rest = merge_box_tiles([sprite])
+    assert blocks == []
+    assert rest == [sprite]
+
+
+def test_off_grid_tile_next_to_block():
+    row = [tile(16 + 32 * col, 16) for col in range(3)]
+    off_grid = tile(21, 48)
+    blocks, rest = merge_box_tiles(row + [off_grid])
+    assert rest == [off_grid]
+    assert len(blocks) == 1
+    assert blocks[0].tiles == [row]
+
+
+def test_duplicate_tile():
+    first, duplicate = tile(16, 16), tile(16, 16)
+    blocks, rest = merge_box_tiles([first, duplicate])
+    assert rest == [duplicate]
+    assert len(blocks) == 1
+    assert blocks[0].tiles == [[first]]
+
+
+def test_stacked_rows_merge():
+    tiles = [[tile(16 + 32 * col, 16 + 32 * row) for col in range(2)] for row in range(3)]
+    blocks, rest = merge_box_tiles([sprite for row in tiles for sprite in row])
+    assert rest == []
+    assert len(blocks) == 1
+    block = blocks[0]
+    assert (block.left, block.bottom, block.rows, block.cols) == (0, 0, 3, 2)
+    assert block.tiles == tiles